@@ -0,0 +1,451 @@
+"""
+Cache stale-while-revalidate dos datasets servidos pela API
+Cada chave tem um TTL "soft" (após o qual é revalidada em segundo plano) e um TTL "hard"
+(após o qual expira no Redis). Um lock no Redis garante que apenas um worker reconstrói a chave.
+
+Na frente do Redis há um cache L1 em memória (LRU por worker). Cada escrita grava uma versão
+nos metadados da chave; o L1 só reaproveita o valor local enquanto a versão no Redis for a mesma.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .storage import storage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", "300"))  # 5 minutos
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", "86400"))  # 24 horas
+CACHE_LOCK_TTL = int(os.getenv("CACHE_LOCK_TTL", "180"))  # tempo máximo de uma reconstrução
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "32"))
+CACHE_L1_CHECK_INTERVAL = float(os.getenv("CACHE_L1_CHECK_INTERVAL", "1.0"))  # segundos sem consultar o Redis
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    soft_ttl: int = CACHE_SOFT_TTL
+    hard_ttl: int = CACHE_HARD_TTL
+    # Campo dos itens indexado em `{key}:index` (valor -> chave do item), ex.: id do card -> slug
+    index_field: Optional[str] = None
+
+
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "courses_data": CachePolicy(index_field="id"),
+    "pre_comite_courses_data": CachePolicy(index_field="id"),
+    "ymed_courses_data": CachePolicy(index_field="id"),
+    "home_data": CachePolicy(soft_ttl=60),  # recalculada a partir dos cursos em cache, é barata
+    "users_data": CachePolicy(),
+    "g2_cursos_data": CachePolicy(soft_ttl=60 * 30),
+    "g2_cursos_search_data": CachePolicy(soft_ttl=60 * 30),
+}
+
+
+@dataclass
+class LoadResult:
+    """
+    Retorno opcional de um loader: o valor e metadados extras gravados junto com a versão
+    (ex.: `synced_at` da sincronização incremental)
+    """
+    value: Any
+    meta: Dict[str, Any]
+
+
+@dataclass
+class _L1Entry:
+    value: Any
+    meta: dict
+    checked_at: float
+    # Valores derivados do documento nesta versão (índices, bytes serializados...), ver get_view
+    derived: Dict[str, Any] = field(default_factory=dict)
+
+
+# Reconstruções em andamento neste worker (single-flight local): chave -> (loader, task)
+_inflight: Dict[str, Tuple[Loader, asyncio.Task]] = {}
+
+# Cache L1 em memória: chave -> valor decodificado + versão vista no Redis
+_l1: "OrderedDict[str, _L1Entry]" = OrderedDict()
+
+
+def get_policy(key: str) -> CachePolicy:
+    return CACHE_POLICIES.get(key, CachePolicy())
+
+
+def _meta_key(key: str) -> str:
+    return f"{key}:meta"
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+def _index_key(key: str) -> str:
+    return f"{key}:index"
+
+
+def _build_index(value: Any, index_field: str) -> Dict[str, str]:
+    return {
+        str(item.get(index_field)): member
+        for member, item in (value or {}).items()
+        if isinstance(item, dict) and item.get(index_field) is not None
+    }
+
+
+def _l1_put(key: str, value: Any, meta: dict):
+    _l1[key] = _L1Entry(value=value, meta=meta, checked_at=time.monotonic())
+    _l1.move_to_end(key)
+    while len(_l1) > CACHE_L1_MAX_ENTRIES:
+        evicted, _ = _l1.popitem(last=False)
+        logger.debug(f"Cache L1: chave {evicted} removida (LRU)")
+
+
+async def _read_meta(key: str) -> Optional[dict]:
+    raw_meta = await storage.get(_meta_key(key))
+    return json.loads(raw_meta) if raw_meta else None
+
+
+async def _read(key: str) -> Tuple[Optional[Any], Optional[dict]]:
+    """
+    Lê o valor e os metadados (fetched_at, version) de uma chave.
+    Usa o L1 quando a versão no Redis não mudou; caso contrário baixa o documento.
+    """
+    entry = _l1.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked_at < CACHE_L1_CHECK_INTERVAL:
+        _l1.move_to_end(key)
+        return entry.value, entry.meta
+
+    meta = await _read_meta(key)
+    if entry is not None and meta and meta.get("version") == entry.meta.get("version"):
+        entry.checked_at = now
+        entry.meta = meta
+        _l1.move_to_end(key)
+        return entry.value, meta
+
+    cached = await storage.json_get(key)
+    value = cached[0] if cached else None
+    if value is not None and meta and meta.get("version"):
+        _l1_put(key, value, meta)
+    else:
+        _l1.pop(key, None)
+    return value, meta
+
+
+async def peek(key: str) -> Tuple[Optional[Any], Optional[dict]]:
+    """Lê o valor e os metadados atuais sem disparar revalidação"""
+    return await _read(key)
+
+
+async def write(key: str, value: Any, extra_meta: Optional[Dict[str, Any]] = None):
+    """Grava o valor com TTL hard e publica uma nova versão (invalida o L1 dos outros workers)"""
+    policy = get_policy(key)
+    meta = {**(extra_meta or {}), "fetched_at": time.time(), "version": uuid.uuid4().hex}
+    await storage.json_set(key, value)
+    await storage.expire(key, policy.hard_ttl)
+    if policy.index_field:
+        await storage.json_set(_index_key(key), _build_index(value, policy.index_field))
+        await storage.expire(_index_key(key), policy.hard_ttl)
+    await storage.set(_meta_key(key), json.dumps(meta), ex=policy.hard_ttl)
+    _l1_put(key, value, meta)
+
+
+def _member_path(member: str) -> str:
+    # Notação de colchetes: slugs têm hífens, que a notação com ponto não aceita
+    return f"$[{json.dumps(member)}]"
+
+
+async def _publish_patch(key: str, apply: Callable[[dict], Any]):
+    """
+    Publica uma nova versão após uma alteração parcial do documento (mantém fetched_at).
+    O L1 deste worker é atualizado no lugar se estava na versão anterior; nos outros, a versão nova
+    faz o próximo _read baixar o documento.
+    """
+    meta = await _read_meta(key) or {}
+    new_meta = {**meta, "version": uuid.uuid4().hex}
+    await storage.set(_meta_key(key), json.dumps(new_meta), ex=get_policy(key).hard_ttl)
+
+    entry = _l1.get(key)
+    if entry is not None and meta.get("version") and entry.meta.get("version") == meta.get("version"):
+        value = dict(entry.value)
+        apply(value)
+        _l1_put(key, value, new_meta)
+    else:
+        _l1.pop(key, None)
+
+
+async def set_member(key: str, member: str, value: Any):
+    """Grava um único item (ex.: um curso pelo slug) de um documento existente via path do RedisJSON"""
+    await set_members(key, {member: value})
+
+
+async def set_members(key: str, members: Dict[str, Any]):
+    """
+    Grava vários itens de um documento existente numa única chamada (JSON.MSET) e publica uma única
+    versão nova. O índice só é regravado para itens novos ou cujo campo indexado mudou.
+    """
+    if not members:
+        return
+    await storage.json_mset([(key, _member_path(member), value) for member, value in members.items()])
+
+    index_field = get_policy(key).index_field
+    if index_field:
+        entry, _ = await _fresh_l1(key)
+        current = entry.value if entry is not None else {}
+        index_entries = {
+            str(value[index_field]): member
+            for member, value in members.items()
+            if isinstance(value, dict)
+            and value.get(index_field) is not None
+            and (current.get(member) or {}).get(index_field) != value[index_field]
+        }
+        if index_entries:
+            await _set_index_entries(key, index_entries)
+    await _publish_patch(key, lambda document: document.update(members))
+
+
+async def delete_member(key: str, member: str):
+    """Remove um único item de um documento existente via path do RedisJSON"""
+    index_field = get_policy(key).index_field
+    if index_field:
+        current = await storage.json_get(key, _member_path(member))
+        item = current[0] if current else None
+        if isinstance(item, dict) and item.get(index_field) is not None:
+            await storage.json_delete(_index_key(key), _member_path(str(item[index_field])))
+    await storage.json_delete(key, _member_path(member))
+    await _publish_patch(key, lambda document: document.pop(member, None))
+
+
+async def _set_index_entries(key: str, entries: Dict[str, str]):
+    index_key = _index_key(key)
+    try:
+        if await storage.json_mset([(index_key, _member_path(index_value), member) for index_value, member in entries.items()]):
+            return
+    except Exception as e:
+        # O RedisJSON recusa paths fora da raiz quando o documento não existe
+        logger.debug(f"Cache {key}: índice ausente ({e})")
+    # Índice ausente (documento gravado antes do índice existir): reconstrói a partir do valor atual
+    value, _ = await _read(key)
+    if value is not None:
+        index = _build_index(value, get_policy(key).index_field)
+        index.update(entries)
+        await storage.json_set(index_key, index)
+        await storage.expire(index_key, get_policy(key).hard_ttl)
+
+
+async def _fresh_l1(key: str) -> Tuple[Optional[_L1Entry], Optional[dict]]:
+    """Retorna a entrada do L1 se ainda estiver na versão publicada, junto com os metadados atuais"""
+    entry = _l1.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked_at < CACHE_L1_CHECK_INTERVAL:
+        return entry, entry.meta
+    meta = await _read_meta(key)
+    if entry is not None and meta and meta.get("version") == entry.meta.get("version"):
+        entry.checked_at = now
+        entry.meta = meta
+        return entry, meta
+    return None, meta
+
+
+def _revalidate_if_stale(key: str, meta: Optional[dict], loader: Loader):
+    age = time.time() - meta.get("fetched_at", 0) if meta else float("inf")
+    if age > get_policy(key).soft_ttl:
+        _ensure_rebuild(key, loader)
+
+
+async def get_member(key: str, member: str, loader: Loader) -> Optional[Any]:
+    """
+    Lê um único item do documento: do L1 quando está na versão atual, senão só o path
+    `$["<member>"]` do RedisJSON (sem baixar o documento inteiro). Carrega a chave se não existir.
+    """
+    entry, meta = await _fresh_l1(key)
+    if entry is not None:
+        _revalidate_if_stale(key, meta, loader)
+        return entry.value.get(member)
+    if not meta:
+        return (await get_or_load(key, loader)).get(member)
+
+    _revalidate_if_stale(key, meta, loader)
+    result = await storage.json_get(key, _member_path(member))
+    return result[0] if result else None
+
+
+async def is_cached(key: str) -> bool:
+    """Há uma versão publicada da chave (sem baixar o documento)"""
+    entry, meta = await _fresh_l1(key)
+    return entry is not None or bool(meta)
+
+
+async def find_member(key: str, index_value: str) -> Optional[str]:
+    """
+    Chave do item pelo campo indexado (ex.: slug pelo id do card) sem carregar o documento:
+    usa o índice derivado do L1 ou o documento de índice no Redis. None se não está em cache.
+    """
+    index_field = get_policy(key).index_field
+    if not index_field:
+        raise ValueError(f"Cache {key} não tem índice configurado")
+
+    entry, meta = await _fresh_l1(key)
+    if entry is not None:
+        index = _derive(entry, "member_index", lambda value: _build_index(value, index_field))
+        return index.get(str(index_value))
+    if not meta:
+        return None
+
+    result = await storage.json_get(_index_key(key), _member_path(str(index_value)))
+    if result is None:
+        # Sem índice no Redis: cai para a leitura do documento
+        value, _ = await _read(key)
+        return _build_index(value, index_field).get(str(index_value)) if value is not None else None
+    return result[0] if result else None
+
+
+async def lookup_member(key: str, index_value: str, loader: Loader) -> Optional[Tuple[str, Any]]:
+    """Encontra um item pelo campo indexado (ex.: id do card) e retorna (chave do item, item)"""
+    entry, meta = await _fresh_l1(key)
+    if entry is None and not meta:
+        await get_or_load(key, loader)
+        entry, meta = await _fresh_l1(key)
+    _revalidate_if_stale(key, meta, loader)
+
+    member = await find_member(key, index_value)
+    if member is None:
+        return None
+    if entry is not None:
+        return member, entry.value.get(member)
+    item = await get_member(key, member, loader)
+    return (member, item) if item is not None else None
+
+
+async def _load_and_write(key: str, loader: Loader) -> Any:
+    result = await loader()
+    if isinstance(result, LoadResult):
+        await write(key, result.value, result.meta)
+        return result.value
+    await write(key, result)
+    return result
+
+
+async def _rebuild(key: str, loader: Loader) -> Optional[Any]:
+    """
+    Reconstrói a chave se conseguir o lock distribuído.
+    Retorna None quando outro worker já está reconstruindo.
+    """
+    token = uuid.uuid4().hex
+    if not await storage.set(_lock_key(key), token, nx=True, ex=CACHE_LOCK_TTL):
+        logger.info(f"Cache {key}: reconstrução em andamento em outro worker")
+        return None
+    try:
+        started = time.monotonic()
+        value = await _load_and_write(key, loader)
+        logger.info(f"Cache {key} reconstruído em {time.monotonic() - started:.1f}s")
+        return value
+    finally:
+        if await storage.get(_lock_key(key)) == token:
+            await storage.delete(_lock_key(key))
+
+
+def _ensure_rebuild(key: str, loader: Loader) -> asyncio.Task:
+    """Retorna a reconstrução em andamento neste worker ou inicia uma nova"""
+    _, task = _inflight.get(key, (None, None))
+    if task is None or task.done():
+        task = asyncio.create_task(_rebuild(key, loader))
+        _inflight[key] = (loader, task)
+        task.add_done_callback(lambda t: _on_rebuild_done(key, t))
+    return task
+
+
+def _on_rebuild_done(key: str, task: asyncio.Task):
+    if _inflight.get(key, (None, None))[1] is task:
+        _inflight.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Erro ao reconstruir cache {key}: {task.exception()}")
+
+
+async def _wait_for_other_worker(key: str, newer_than: float) -> Optional[Any]:
+    """Aguarda outro worker terminar a reconstrução e publicar um valor mais novo"""
+    deadline = time.monotonic() + CACHE_LOCK_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+        value, meta = await _read(key)
+        if value is not None and meta and meta.get("fetched_at", 0) >= newer_than:
+            return value
+        if not await storage.get(_lock_key(key)):
+            break
+    return None
+
+
+async def _load_now(key: str, loader: Loader, newer_than: float) -> Any:
+    value = await asyncio.shield(_ensure_rebuild(key, loader))
+    if value is not None:
+        return value
+    value = await _wait_for_other_worker(key, newer_than)
+    if value is not None:
+        return value
+    # O outro worker falhou ou expirou o lock: carrega diretamente
+    return await _load_and_write(key, loader)
+
+
+async def get_or_load(key: str, loader: Loader) -> Any:
+    """
+    Retorna o valor em cache. Se o TTL soft expirou, agenda a revalidação em segundo plano
+    e devolve o valor antigo. Só bloqueia o chamador quando a chave não existe.
+    """
+    value, meta = await _read(key)
+    if value is not None:
+        age = time.time() - meta.get("fetched_at", 0) if meta else float("inf")
+        if age > get_policy(key).soft_ttl:
+            logger.info(f"Cache {key} com {age:.0f}s, revalidando em segundo plano")
+            _ensure_rebuild(key, loader)
+        return value
+
+    logger.info(f"Cache {key} vazio, carregando")
+    return await _load_now(key, loader, newer_than=0)
+
+
+def _derive(entry: _L1Entry, name: str, build: Callable[[Any], Any]) -> Any:
+    if name not in entry.derived:
+        entry.derived[name] = build(entry.value)
+    return entry.derived[name]
+
+
+async def get_view(key: str, loader: Loader, name: str, build: Callable[[Any], Any]) -> Tuple[Any, Optional[dict]]:
+    """
+    Como get_or_load, mas devolve `build(valor)` memoizado por versão no L1 (calculado uma vez
+    por worker a cada nova versão) junto com os metadados da versão.
+    Sem L1 (ex.: valor que não coube no LRU), calcula sem memoizar e devolve meta None.
+    """
+    value = await get_or_load(key, loader)
+    entry = _l1.get(key)
+    if entry is None or entry.value is not value:
+        return build(value), None
+    return _derive(entry, name, build), entry.meta
+
+
+async def refresh(key: str, loader: Loader) -> Any:
+    """
+    Força a reconstrução da chave com `loader` e aguarda o novo valor.
+    Só aproveita a reconstrução em andamento se ela usa o mesmo loader; com outro (ex.: sync
+    incremental durante um refresh completo), espera ela terminar e reconstrói em seguida.
+    """
+    while key in _inflight:
+        running_loader, task = _inflight[key]
+        if task.done() or running_loader is loader:
+            break
+        await asyncio.wait({task})
+    return await _load_now(key, loader, newer_than=time.time())
+
+
+def schedule_refresh(key: str, loader: Loader) -> asyncio.Task:
+    """Agenda a reconstrução em segundo plano (single-flight); quem chama não espera a varredura"""
+    return _ensure_rebuild(key, loader)
@@ -0,0 +1,98 @@
+"""
+Pool limitado para trabalho de CPU (bcrypt) fora do event loop
+O bcrypt libera o GIL durante o hash, então threads dedicadas rodam em paralelo de verdade.
+Um semáforo limita as execuções simultâneas; o excedente espera em fila (medida em /health).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CPU_POOL_MAX_WORKERS = int(os.getenv("CPU_POOL_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_POOL_QUEUE_TIMEOUT = float(os.getenv("CPU_POOL_QUEUE_TIMEOUT", "10"))  # espera máxima por uma vaga
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_semaphore = asyncio.Semaphore(CPU_POOL_MAX_WORKERS)
+_metrics = {
+    "waiting": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "max_waiting": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CPU_POOL_MAX_WORKERS, thread_name_prefix="cpu-pool")
+    return _executor
+
+
+async def run_cpu_bound(func: Callable[..., T], *args: Any) -> T:
+    """Executa `func(*args)` no pool; recusa com 503 se a fila demorar mais que CPU_POOL_QUEUE_TIMEOUT"""
+    queued_at = time.monotonic()
+    _metrics["waiting"] += 1
+    _metrics["max_waiting"] = max(_metrics["max_waiting"], _metrics["waiting"])
+    try:
+        await asyncio.wait_for(_semaphore.acquire(), timeout=CPU_POOL_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _metrics["rejected"] += 1
+        logger.warning(f"Fila do pool de CPU cheia ({_metrics['waiting']} aguardando)")
+        raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente em instantes")
+    finally:
+        _metrics["waiting"] -= 1
+
+    started = time.monotonic()
+    _metrics["running"] += 1
+    _metrics["total_wait_ms"] += (started - queued_at) * 1000
+
+    def finished(_):
+        # A vaga só é devolvida quando a thread termina, mesmo que quem esperava tenha sido cancelado
+        _metrics["running"] -= 1
+        _metrics["completed"] += 1
+        _metrics["total_run_ms"] += (time.monotonic() - started) * 1000
+        _semaphore.release()
+
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    except BaseException:
+        finished(None)
+        raise
+    future.add_done_callback(finished)
+    # shield: cancelar o chamador (ex.: cliente desconectou) não marca o future como concluído antes da thread
+    return await asyncio.shield(future)
+
+
+def cpu_pool_stats() -> Dict[str, Any]:
+    completed = _metrics["completed"] or 1
+    return {
+        "max_workers": CPU_POOL_MAX_WORKERS,
+        "running": _metrics["running"],
+        "queue_depth": _metrics["waiting"],
+        "max_queue_depth": _metrics["max_waiting"],
+        "completed": _metrics["completed"],
+        "rejected": _metrics["rejected"],
+        "avg_wait_ms": round(_metrics["total_wait_ms"] / completed, 1),
+        "avg_run_ms": round(_metrics["total_run_ms"] / completed, 1),
+    }
+
+
+def close_cpu_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
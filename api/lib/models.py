@@ -66,6 +66,10 @@ class CourseYMED(BaseModel):
 class ApiResponse(BaseModel):
     data: Optional[Dict[str, Any]] = None
 
+class PipefyWebhook(BaseModel):
+    # {"data": {"action": "card.move", "card": {"id": ...}, "from": {...}, "to": {...}}}
+    data: Dict[str, Any]
+
 # Modelos de Auth
 class User(BaseModel):
     id: int
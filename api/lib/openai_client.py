@@ -0,0 +1,86 @@
+"""
+Cliente assíncrono compartilhado da OpenAI
+Limita o número de chamadas simultâneas por worker e cancela o trabalho quando o cliente HTTP desconecta
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Optional, TypeVar
+
+from openai import AsyncOpenAI
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # segundos por requisição
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))  # espera máxima por uma vaga
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+
+T = TypeVar("T")
+
+_client: Optional[AsyncOpenAI] = None
+_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+
+def get_openai_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            logger.error("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+            raise ValueError("OPENAI_API_KEY não configurada")
+        _client = AsyncOpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+
+async def close_openai_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+    _client = None
+
+
+@asynccontextmanager
+async def openai_slot():
+    """Reserva uma das vagas de chamada à OpenAI; recusa com 503 se a fila demorar demais"""
+    try:
+        await asyncio.wait_for(_semaphore.acquire(), timeout=OPENAI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Fila de chamadas à OpenAI cheia")
+        raise HTTPException(status_code=503, detail="Assistente ocupado, tente novamente em instantes")
+    try:
+        yield
+    finally:
+        _semaphore.release()
+
+
+async def run_until_disconnect(request: Request, work: Awaitable[T], poll_interval: float = 0.5) -> T:
+    """
+    Executa `work` e o cancela se o cliente HTTP desconectar antes do fim,
+    liberando a vaga da OpenAI e evitando gastar tokens com uma resposta que ninguém vai ler.
+    """
+    task = asyncio.ensure_future(work)
+
+    async def watch():
+        while not task.done():
+            if await request.is_disconnected():
+                logger.info("Cliente desconectou, cancelando chamada à OpenAI")
+                task.cancel()
+                return
+            await asyncio.sleep(poll_interval)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if task.cancelled() and watcher.done():
+            # Status não-padrão (nginx) para requisição abandonada pelo cliente
+            raise HTTPException(status_code=499, detail="Requisição cancelada pelo cliente")
+        raise
+    finally:
+        watcher.cancel()
@@ -0,0 +1,117 @@
+"""
+Cache de parsing por conteúdo dos cards do Pipefy
+Cada card é identificado por um hash do payload bruto (fields, child_relations, ...) e da versão do parser.
+Cards que não mudaram desde a última varredura reaproveitam o objeto já construído, então o custo
+de CPU de um refresh cresce com o número de cards alterados, não com o total.
+
+As entradas ficam em memória (por worker) e no Redis ao lado do cache dos cursos,
+para que um worker recém-iniciado também aproveite o parsing anterior.
+"""
+
+import json
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Generic, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from .cache import CACHE_HARD_TTL
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def content_digest(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ParseCache(Generic[M]):
+    """
+    Objetos já parseados, indexados pelo hash do card. Os objetos são compartilhados entre
+    refreshes e devem ser tratados como somente leitura.
+    """
+
+    def __init__(self, name: str, model: Type[M], version: str):
+        self.key = f"parse_cache:{name}"
+        self.model = model
+        self.version = version
+        self._entries: Dict[str, Optional[M]] = {}
+        self._loaded = False
+
+    async def _load(self):
+        """Na primeira varredura do worker, recupera as entradas persistidas no Redis"""
+        self._loaded = True
+        try:
+            cached = await storage.json_get(self.key)
+            stored = cached[0] if cached else None
+        except Exception as e:
+            logger.warning(f"Parse cache {self.key}: erro ao ler do Redis ({e})")
+            return
+        if not stored or stored.get("version") != self.version:
+            return
+        for digest, data in (stored.get("entries") or {}).items():
+            self._entries[digest] = self.model.model_validate(data) if data is not None else None
+        logger.info(f"Parse cache {self.key}: {len(self._entries)} cards recuperados do Redis")
+
+    async def session(self) -> "ParseSession[M]":
+        if not self._loaded:
+            await self._load()
+        return ParseSession(self)
+
+    async def _save(self, entries: Dict[str, Optional[M]]):
+        self._entries = entries
+        document = {
+            "version": self.version,
+            "entries": {
+                digest: course.model_dump(mode="json") if course is not None else None
+                for digest, course in entries.items()
+            },
+        }
+        try:
+            await storage.json_set(self.key, document)
+            await storage.expire(self.key, CACHE_HARD_TTL)
+        except Exception as e:
+            # O cache de parsing é só uma otimização: falhar aqui não invalida o refresh
+            logger.warning(f"Parse cache {self.key}: erro ao gravar no Redis ({e})")
+
+
+class ParseSession(Generic[M]):
+    """Uma varredura completa: registra os cards vistos e descarta, ao final, os que sumiram ou mudaram"""
+
+    def __init__(self, cache: ParseCache[M]):
+        self._cache = cache
+        self._seen: Dict[str, Optional[M]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, node: dict, parser: Callable[[dict], Optional[M]], *context: Any) -> Optional[M]:
+        digest = content_digest(self._cache.version, node, *context)
+        if digest in self._seen:
+            return self._seen[digest]
+        if digest in self._cache._entries:
+            self.hits += 1
+            parsed = self._cache._entries[digest]
+        else:
+            self.misses += 1
+            parsed = parser(node)
+        self._seen[digest] = parsed
+        return parsed
+
+    async def commit(self):
+        cache = self._cache
+        removed = len(cache._entries.keys() - self._seen.keys())
+        logger.info(f"Parse cache {cache.key}: {self.hits} reaproveitados, {self.misses} parseados, {removed} descartados")
+        if self.misses or removed:
+            await cache._save(self._seen)
+
+
+_caches: Dict[str, ParseCache] = {}
+
+
+def get_parse_cache(name: str, model: Type[M], version: str) -> ParseCache[M]:
+    if name not in _caches:
+        _caches[name] = ParseCache(name, model, version)
+    return _caches[name]
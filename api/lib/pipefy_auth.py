@@ -73,36 +73,39 @@ async def get_pipefy_token() -> str:
             "Defina PIPEFY_SERVICE_ACCOUNT_ID e PIPEFY_SERVICE_ACCOUNT_SECRET"
         )
 
+    # Import tardio: pipefy_client depende deste módulo para os headers
+    from .pipefy_client import get_pipefy_client
+
     try:
-        async with httpx.AsyncClient() as client:
-            logger.info("Obtendo novo token OAuth 2.0 do Pipefy")
-            response = await client.post(
-                PIPEFY_OAUTH_URL,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": PIPEFY_SERVICE_ACCOUNT_ID,
-                    "client_secret": PIPEFY_SERVICE_ACCOUNT_SECRET,
-                },
-                timeout=10.0,
-            )
+        client = get_pipefy_client()
+        logger.info("Obtendo novo token OAuth 2.0 do Pipefy")
+        response = await client.post(
+            PIPEFY_OAUTH_URL,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": PIPEFY_SERVICE_ACCOUNT_ID,
+                "client_secret": PIPEFY_SERVICE_ACCOUNT_SECRET,
+            },
+            timeout=10.0,
+        )
 
-            if not response.is_success:
-                error_msg = f"Erro ao obter token Pipefy: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=error_msg,
-                )
+        if not response.is_success:
+            error_msg = f"Erro ao obter token Pipefy: {response.status_code} - {response.text}"
+            logger.error(error_msg)
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=error_msg,
+            )
 
-            data = response.json()
-            _cached_token = data.get("access_token")
-            expires_in = data.get("expires_in", 3600)  # Default 1 hora
+        data = response.json()
+        _cached_token = data.get("access_token")
+        expires_in = data.get("expires_in", 3600)  # Default 1 hora
 
-            # Cachear token com 5 minutos de margem de segurança
-            _token_expiry = datetime.now() + timedelta(seconds=expires_in - 300)
+        # Cachear token com 5 minutos de margem de segurança
+        _token_expiry = datetime.now() + timedelta(seconds=expires_in - 300)
 
-            logger.info(f"✓ Token obtido com sucesso. Expira em {expires_in}s")
-            return _cached_token
+        logger.info(f"✓ Token obtido com sucesso. Expira em {expires_in}s")
+        return _cached_token
 
     except httpx.RequestError as e:
         error_msg = f"Erro de conexão ao obter token Pipefy: {str(e)}"
@@ -0,0 +1,177 @@
+"""
+Cliente HTTP compartilhado para a API GraphQL do Pipefy
+Mantém um único pool de conexões (HTTP/2 + keep-alive) durante a vida da aplicação.
+Toda requisição passa pelo agendador (ver pipefy_scheduler): limite de taxa, prioridade e retentativas.
+"""
+
+import os
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+from .pipefy_auth import get_pipefy_headers, PIPEFY_API_URL
+from .pipefy_scheduler import scheduler
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Configuração do pool (ajustável via .env)
+PIPEFY_HTTP2 = os.getenv("PIPEFY_HTTP2", "true").lower() in ("1", "true", "yes")
+PIPEFY_MAX_CONNECTIONS = int(os.getenv("PIPEFY_MAX_CONNECTIONS", "20"))
+PIPEFY_MAX_KEEPALIVE = int(os.getenv("PIPEFY_MAX_KEEPALIVE", "10"))
+PIPEFY_KEEPALIVE_EXPIRY = float(os.getenv("PIPEFY_KEEPALIVE_EXPIRY", "60"))
+PIPEFY_CONNECT_TIMEOUT = float(os.getenv("PIPEFY_CONNECT_TIMEOUT", "5"))
+PIPEFY_READ_TIMEOUT = float(os.getenv("PIPEFY_READ_TIMEOUT", "30"))
+PIPEFY_POOL_TIMEOUT = float(os.getenv("PIPEFY_POOL_TIMEOUT", "10"))
+
+# Retentativas em 429/5xx transitórios: Retry-After quando o Pipefy informa, senão backoff exponencial com jitter
+PIPEFY_MAX_RETRIES = int(os.getenv("PIPEFY_MAX_RETRIES", "4"))
+PIPEFY_BACKOFF_BASE = float(os.getenv("PIPEFY_BACKOFF_BASE", "0.5"))
+PIPEFY_BACKOFF_MAX = float(os.getenv("PIPEFY_BACKOFF_MAX", "20"))
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 no httpx depende do pacote opcional `h2`"""
+    if not PIPEFY_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("Pacote 'h2' não instalado, usando HTTP/1.1 para o Pipefy")
+        return False
+
+
+def _build_client(http2: bool) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=PIPEFY_MAX_CONNECTIONS,
+            max_keepalive_connections=PIPEFY_MAX_KEEPALIVE,
+            keepalive_expiry=PIPEFY_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            PIPEFY_READ_TIMEOUT,
+            connect=PIPEFY_CONNECT_TIMEOUT,
+            pool=PIPEFY_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def start_pipefy_client() -> httpx.AsyncClient:
+    """Cria o cliente compartilhado. Chamado no lifespan da aplicação."""
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = _http2_available()
+        _client = _build_client(http2)
+        logger.info(f"Cliente Pipefy iniciado (http2={http2}, max_connections={PIPEFY_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_pipefy_client():
+    """Fecha o pool de conexões. Chamado no encerramento da aplicação."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Cliente Pipefy encerrado")
+    _client = None
+
+
+def get_pipefy_client() -> httpx.AsyncClient:
+    """
+    Retorna o cliente compartilhado.
+    Fora do lifespan (scripts, diagnóstico) cria o cliente sob demanda.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client(_http2_available())
+    return _client
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After em segundos (aceita o formato numérico e a data HTTP)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: espalha as retentativas de requisições que falharam juntas
+    return random.uniform(0, min(PIPEFY_BACKOFF_MAX, PIPEFY_BACKOFF_BASE * 2 ** attempt))
+
+
+def _is_mutation(query: str) -> bool:
+    return query.lstrip().startswith("mutation")
+
+
+async def execute(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Executa uma query/mutation GraphQL no Pipefy usando o pool compartilhado.
+    Retorna o corpo JSON completo (incluindo `errors`, quando houver).
+    Levanta HTTPException se a resposta HTTP não for de sucesso.
+
+    A fila (interativa ou segundo plano) vem do contexto (pipefy_lane).
+    Queries são repetidas até PIPEFY_MAX_RETRIES vezes em 429/502/503/504 e falhas de rede.
+    Mutations só em 429 (o Pipefy recusou a requisição antes de processá-la): um 5xx do gateway
+    ou uma conexão que caiu podem chegar depois da mutation já aplicada, e repetir duplicaria
+    comentários, e-mails e gravações.
+    """
+    payload: Dict[str, Any] = {"query": query}
+    if variables is not None:
+        payload["variables"] = variables
+
+    attempt = 0
+    while True:
+        await scheduler.acquire()
+        headers = await get_pipefy_headers()
+        try:
+            response = await get_pipefy_client().post(PIPEFY_API_URL, headers=headers, json=payload)
+        except httpx.TransportError as error:
+            if _is_mutation(query) or attempt >= PIPEFY_MAX_RETRIES:
+                logger.error(f"Falha de conexão com o Pipefy: {error!r}")
+                raise HTTPException(status_code=503, detail=f"Falha de conexão com o Pipefy: {error!r}")
+            delay = _backoff(attempt)
+            logger.warning(f"Falha de conexão com o Pipefy ({error!r}), tentando novamente em {delay:.1f}s")
+        else:
+            if response.is_success:
+                return response.json()
+            retryable = response.status_code == 429 if _is_mutation(query) else response.status_code in RETRYABLE_STATUS
+            if not retryable or attempt >= PIPEFY_MAX_RETRIES:
+                logger.error(f"Erro na requisição ao Pipefy: {response.status_code} - {response.text[:500]}")
+                if response.status_code == 429:
+                    # Limite esgotado mesmo após as retentativas: indisponibilidade temporária, não erro da API
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Limite de requisições do Pipefy atingido, tente novamente em instantes",
+                        headers={"Retry-After": str(int(_retry_after(response) or PIPEFY_BACKOFF_MAX))},
+                    )
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"Erro na requisição ao Pipefy: {response.text[:500]}",
+                )
+            retry_after = _retry_after(response)
+            delay = retry_after if retry_after is not None else _backoff(attempt)
+            if response.status_code == 429:
+                # O limite é da conta inteira: segura todas as filas, não só esta requisição
+                scheduler.pause(delay)
+            logger.warning(f"Pipefy respondeu {response.status_code}, tentando novamente em {delay:.1f}s")
+        attempt += 1
+        await asyncio.sleep(delay)
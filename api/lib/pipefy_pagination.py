@@ -0,0 +1,70 @@
+"""
+Paginação assíncrona de conexões GraphQL do Pipefy (cards de fase, table_records, ...)
+A próxima página é requisitada assim que o endCursor chega, em paralelo ao parsing da atual
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from .pipefy_client import execute
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# O Pipefy aceita no máximo 50 itens por página
+PIPEFY_PAGE_SIZE = min(int(os.getenv("PIPEFY_PAGE_SIZE", "50")), 50)
+
+
+async def _fetch_page(query: str, variables: Dict[str, Any], connection_path: Sequence[str]) -> Dict[str, Any]:
+    response = await execute(query, variables)
+    if response.get("errors") and not response.get("data"):
+        raise Exception(response["errors"][0].get("message", "Erro GraphQL no Pipefy"))
+
+    connection: Any = response.get("data") or {}
+    for key in connection_path:
+        connection = (connection or {}).get(key)
+    return connection or {}
+
+
+async def paginate(
+    query: str,
+    connection_path: Sequence[str],
+    variables: Optional[Dict[str, Any]] = None,
+    page_size: Optional[int] = None,
+    after: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Percorre uma conexão paginada do Pipefy e entrega cada página (edges/nodes + pageInfo).
+
+    A query deve declarar as variáveis `$first: Int` e `$after: String` e pedir
+    `pageInfo { hasNextPage endCursor }` na conexão indicada por `connection_path`,
+    ex.: ("phase", "cards") ou ("table_records",).
+    `after` continua de uma página já obtida por outra requisição (ex.: a primeira página de várias fases).
+    """
+    base_variables = {**(variables or {}), "first": page_size or PIPEFY_PAGE_SIZE, "after": None}
+    pending = asyncio.create_task(_fetch_page(query, {**base_variables, "after": after}, connection_path))
+    pages = 0
+
+    try:
+        while pending is not None:
+            connection = await pending
+            pending = None
+            pages += 1
+
+            # Dispara a próxima página antes de devolver a atual para o consumidor
+            page_info = connection.get("pageInfo") or {}
+            cursor = page_info.get("endCursor")
+            if page_info.get("hasNextPage") and cursor:
+                pending = asyncio.create_task(
+                    _fetch_page(query, {**base_variables, "after": cursor}, connection_path)
+                )
+
+            yield connection
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+        logger.debug(f"Paginação de {'.'.join(connection_path)} concluída em {pages} página(s)")
@@ -0,0 +1,180 @@
+"""
+Agendador das requisições ao Pipefy
+Um token bucket mantém o ritmo dentro do limite do plano e duas filas de prioridade decidem quem usa
+o próximo token: chamadas interativas (status, comentários, login) passam na frente das varreduras
+em segundo plano (refresh de cursos, diretório de usuários).
+
+A fila de uma requisição vem do contexto (`pipefy_lane`), então as varreduras marcam a si mesmas
+e todo o resto continua interativo sem mudar as chamadas a `execute`.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+# Limite do plano: PIPEFY_RATE_LIMIT requisições a cada PIPEFY_RATE_PERIOD segundos (com margem de segurança)
+PIPEFY_RATE_LIMIT = int(os.getenv("PIPEFY_RATE_LIMIT", "450"))
+PIPEFY_RATE_PERIOD = float(os.getenv("PIPEFY_RATE_PERIOD", "30"))
+PIPEFY_RATE_BURST = int(os.getenv("PIPEFY_RATE_BURST", "20"))
+# Espera máxima de uma chamada interativa por um token (as de segundo plano esperam o quanto for preciso)
+PIPEFY_INTERACTIVE_QUEUE_TIMEOUT = float(os.getenv("PIPEFY_INTERACTIVE_QUEUE_TIMEOUT", "10"))
+
+_lane: ContextVar[str] = ContextVar("pipefy_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def pipefy_lane(lane: str) -> Iterator[None]:
+    """Requisições ao Pipefy feitas dentro do bloco (e das tasks criadas nele) usam a fila `lane`"""
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class PipefyScheduler:
+    """Token bucket com filas por prioridade; uma pausa global (Retry-After) segura todas as filas"""
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._metrics = {lane: {"granted": 0, "rejected": 0, "max_waiting": 0, "total_wait_ms": 0.0} for lane in LANES}
+        self._throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters[lane] for lane in LANES)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    async def _dispatch(self):
+        try:
+            while self._has_waiters():
+                self._refill()
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self._rate)
+                    continue
+                future = self._next_waiter()
+                if future is None:
+                    break
+                self._tokens -= 1
+                future.set_result(None)
+        finally:
+            self._dispatcher = None
+
+    async def _wait(self, lane: str):
+        self._refill()
+        if not self._has_waiters() and self._tokens >= 1 and time.monotonic() >= self._paused_until:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        metrics = self._metrics[lane]
+        metrics["max_waiting"] = max(metrics["max_waiting"], len(self._waiters[lane]))
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._tokens += 1  # token concedido a quem desistiu: devolve ao bucket
+            raise
+
+    async def acquire(self):
+        """
+        Espera um token na fila do contexto atual (pipefy_lane); chamadas interativas desistem
+        com 503 após PIPEFY_INTERACTIVE_QUEUE_TIMEOUT
+        """
+        lane = current_lane()
+        queued_at = time.monotonic()
+        try:
+            if lane == INTERACTIVE:
+                await asyncio.wait_for(self._wait(lane), timeout=PIPEFY_INTERACTIVE_QUEUE_TIMEOUT)
+            else:
+                await self._wait(lane)
+        except asyncio.TimeoutError:
+            self._metrics[lane]["rejected"] += 1
+            logger.warning(f"Fila do Pipefy cheia: {len(self._waiters[lane])} chamadas {lane} aguardando")
+            raise HTTPException(
+                status_code=503,
+                detail="Pipefy sobrecarregado, tente novamente em instantes",
+                headers={"Retry-After": str(int(PIPEFY_INTERACTIVE_QUEUE_TIMEOUT))},
+            )
+        metrics = self._metrics[lane]
+        metrics["granted"] += 1
+        metrics["total_wait_ms"] += (time.monotonic() - queued_at) * 1000
+
+    def pause(self, seconds: float):
+        """Limite atingido (429): nenhuma fila recebe tokens até o Retry-After passar"""
+        self._throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        logger.warning(f"Pipefy limitou as requisições: pausando por {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        lanes = {}
+        for lane in LANES:
+            metrics = self._metrics[lane]
+            granted = metrics["granted"] or 1
+            lanes[lane] = {
+                "queue_depth": sum(1 for future in self._waiters[lane] if not future.done()),
+                "max_queue_depth": metrics["max_waiting"],
+                "granted": metrics["granted"],
+                "rejected": metrics["rejected"],
+                "avg_wait_ms": round(metrics["total_wait_ms"] / granted, 1),
+            }
+        return {
+            "rate_per_second": round(self._rate, 2),
+            "burst": self._burst,
+            "tokens": round(self._tokens, 1),
+            "paused_for_s": round(max(self._paused_until - time.monotonic(), 0.0), 1),
+            "throttled": self._throttled,
+            "lanes": lanes,
+        }
+
+
+scheduler = PipefyScheduler(PIPEFY_RATE_LIMIT / PIPEFY_RATE_PERIOD, PIPEFY_RATE_BURST)
+
+
+def pipefy_scheduler_stats() -> Dict[str, Any]:
+    return scheduler.stats()
@@ -0,0 +1,157 @@
+"""
+Respostas JSON pré-serializadas a partir do cache
+O corpo final (já ordenado e codificado com orjson) e seu hash são calculados uma vez por versão
+do cache; uma requisição servida do cache só devolve os bytes prontos.
+
+O hash do conteúdo é usado como ETag forte: clientes que enviam um If-None-Match igual
+recebem 304 sem corpo.
+
+Corpos grandes também ganham variantes brotli/gzip, comprimidas junto com a serialização
+(uma vez por versão) e escolhidas pelo Accept-Encoding da requisição.
+"""
+
+import os
+import gzip
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from . import cache
+
+try:
+    import brotli
+except ImportError:  # dependência opcional: sem ela, só gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Chaves int (ex.: usuários indexados pelo id) aparecem no L1 do worker que gravou o valor
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# Dados autenticados: o navegador pode guardar, mas revalida (If-None-Match) a cada uso
+RESPONSE_CACHE_CONTROL = os.getenv("RESPONSE_CACHE_CONTROL", "private, no-cache")
+
+# Compressão dos corpos em cache (feita uma vez por versão, então vale um nível mais alto)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Preferência do servidor entre as codificações aceitas pelo cliente
+ENCODING_PREFERENCE = ("br", "gzip")
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+@dataclass(frozen=True)
+class SerializedBody:
+    body: bytes
+    digest: str  # hash do conteúdo (blake2b, 128 bits)
+    variants: Dict[str, bytes] = field(default_factory=dict)  # Content-Encoding -> corpo comprimido
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return {}
+    variants = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def serialize(value: Any, compress: bool = False) -> SerializedBody:
+    body = orjson.dumps(value, option=ORJSON_OPTIONS)
+    return SerializedBody(
+        body=body,
+        digest=hashlib.blake2b(body, digest_size=16).hexdigest(),
+        variants=compress_variants(body) if compress else {},
+    )
+
+
+def choose_encoding(accept_encoding: Optional[str], available: Dict[str, bytes]) -> Optional[str]:
+    """Escolhe br/gzip conforme o Accept-Encoding (respeitando q=0); None = identity"""
+    if not accept_encoding or not available:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ENCODING_PREFERENCE:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > 0:
+            return encoding
+    return None
+
+
+async def get_serialized(
+    key: str,
+    loader: cache.Loader,
+    transform: Optional[Callable[[Any], Any]] = None,
+    view: str = "json",
+) -> SerializedBody:
+    """Corpo serializado da chave; `transform` (ex.: ordenação) roda só quando a versão muda"""
+    def build(value: Any) -> SerializedBody:
+        serialized = serialize(transform(value) if transform else value, compress=True)
+        if serialized.variants:
+            sizes = ", ".join(f"{enc} {len(body)}" for enc, body in serialized.variants.items())
+            logger.info(f"Resposta {key}/{view}: {len(serialized.body)} bytes ({sizes})")
+        return serialized
+
+    serialized, _ = await cache.get_view(key, loader, view, build)
+    return serialized
+
+
+def etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    """Compara com o hash do conteúdo, valendo para qualquer variante (identity, -gz, -br)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match usa comparação fraca: W/"x" equivale a "x"
+    return "*" in candidates or any(
+        tag.removeprefix("W/").strip('"').split("-")[0] == digest for tag in candidates
+    )
+
+
+def serialized_response(
+    serialized: SerializedBody,
+    request: Optional[Request] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    encoding = choose_encoding(request.headers.get("accept-encoding") if request is not None else None, serialized.variants)
+    # ETag forte diferente por variante: os bytes de cada codificação são diferentes
+    etag = f'"{serialized.digest}{ETAG_SUFFIXES.get(encoding, "")}"'
+    response_headers = {**(headers or {}), "ETag": etag, "Cache-Control": RESPONSE_CACHE_CONTROL}
+    if serialized.variants:
+        response_headers["Vary"] = "Accept-Encoding"
+    if request is not None and etag_matches(request.headers.get("if-none-match"), serialized.digest):
+        return Response(status_code=304, headers=response_headers)
+    if encoding is None:
+        return Response(content=serialized.body, media_type="application/json", headers=response_headers)
+    response_headers["Content-Encoding"] = encoding
+    return Response(content=serialized.variants[encoding], media_type="application/json", headers=response_headers)
+
+
+def json_response(content: Any, request: Optional[Request] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Resposta de conteúdo calculado por requisição (filtros, item único), também com ETag"""
+    return serialized_response(serialize(content), request, headers)
+
+
+async def cached_json_response(
+    key: str,
+    loader: cache.Loader,
+    transform: Optional[Callable[[Any], Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    view: str = "json",
+    request: Optional[Request] = None,
+) -> Response:
+    serialized = await get_serialized(key, loader, transform, view)
+    return serialized_response(serialized, request, headers)
@@ -0,0 +1,29 @@
+"""
+Utilitários para respostas Server-Sent Events (SSE)
+"""
+
+import json
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Formata um evento SSE com payload JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Envia os eventos assim que são gerados.
+    Se o cliente desconectar, o Starlette cancela o gerador (e a chamada à OpenAI junto).
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # evita buffering em proxies (Render/nginx)
+        },
+    )
@@ -0,0 +1,146 @@
+"""
+Acesso assíncrono ao Redis para os handlers da API
+Usa o cliente REST assíncrono do Upstash ou o redis.asyncio (conexão TCP via REDIS_URL)
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# "upstash" | "redis". Sem valor explícito, prefere o Upstash REST quando configurado
+# (REDIS_URL é obrigatória no lifespan, então sozinha não indica a escolha do backend)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "").lower()
+
+
+class Storage(ABC):
+    """Interface comum aos backends. Os clientes são criados sob demanda, já dentro do event loop."""
+
+    backend = ""
+
+    def __init__(self):
+        self._client = None
+
+    @abstractmethod
+    def _connect(self):
+        """Cria o cliente do backend"""
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._connect()
+        return self._client
+
+    async def ping(self) -> bool:
+        return bool(await self.client.ping())
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> bool:
+        return bool(await self.client.set(key, value, ex=ex, nx=nx))
+
+    async def delete(self, *keys: str) -> int:
+        return await self.client.delete(*keys)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return bool(await self.client.expire(key, seconds))
+
+    @abstractmethod
+    async def json_get(self, key: str, path: str = "$") -> Optional[list]:
+        """Valores do RedisJSON em `path` (lista, como no JSONPath), ou None se a chave não existir"""
+
+    @abstractmethod
+    async def json_set(self, key: str, value: Any, path: str = "$", nx: bool = False) -> bool:
+        """Grava `value` em `path` do documento"""
+
+    @abstractmethod
+    async def json_mset(self, items: List[Tuple[str, str, Any]]) -> bool:
+        """Grava vários (chave, path, valor) numa única chamada (JSON.MSET, atômico)"""
+
+    @abstractmethod
+    async def json_delete(self, key: str, path: str = "$") -> int:
+        """Remove `path` do documento; retorna quantos valores foram removidos"""
+
+    async def close(self):
+        self._client = None
+
+
+class UpstashStorage(Storage):
+    backend = "upstash"
+
+    def _connect(self):
+        from upstash_redis.asyncio import Redis
+        return Redis.from_env()
+
+    async def json_get(self, key: str, path: str = "$") -> Optional[list]:
+        return await self.client.json.get(key, path)
+
+    async def json_set(self, key: str, value: Any, path: str = "$", nx: bool = False) -> bool:
+        return bool(await self.client.json.set(key, path, value, nx=nx))
+
+    async def json_mset(self, items: List[Tuple[str, str, Any]]) -> bool:
+        return bool(await self.client.json.mset(items))
+
+    async def json_delete(self, key: str, path: str = "$") -> int:
+        return await self.client.json.delete(key, path)
+
+    async def close(self):
+        if self._client is not None and hasattr(self._client, "close"):
+            await self._client.close()
+        self._client = None
+
+
+class RedisStorage(Storage):
+    backend = "redis"
+
+    def __init__(self, url: str):
+        super().__init__()
+        self._url = url
+
+    def _connect(self):
+        import redis.asyncio as aioredis
+        return aioredis.from_url(self._url, decode_responses=True)
+
+    async def json_get(self, key: str, path: str = "$") -> Optional[list]:
+        return await self.client.json().get(key, path)
+
+    async def json_set(self, key: str, value: Any, path: str = "$", nx: bool = False) -> bool:
+        return bool(await self.client.json().set(key, path, value, nx=nx))
+
+    async def json_mset(self, items: List[Tuple[str, str, Any]]) -> bool:
+        return bool(await self.client.json().mset(items))
+
+    async def json_delete(self, key: str, path: str = "$") -> int:
+        return await self.client.json().delete(key, path)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+
+
+def create_storage() -> Storage:
+    redis_url = os.getenv("REDIS_URL")
+    upstash_configured = bool(os.getenv("UPSTASH_REDIS_REST_URL"))
+
+    if STORAGE_BACKEND == "redis" or (not STORAGE_BACKEND and not upstash_configured and redis_url):
+        if not redis_url:
+            raise RuntimeError("STORAGE_BACKEND=redis requer REDIS_URL")
+        logger.info("Storage: redis.asyncio (REDIS_URL)")
+        return RedisStorage(redis_url)
+
+    logger.info("Storage: Upstash REST assíncrono")
+    return UpstashStorage()
+
+
+storage = create_storage()
+
+
+async def close_storage():
+    await storage.close()
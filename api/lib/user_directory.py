@@ -0,0 +1,190 @@
+"""
+Diretório de usuários em memória (por worker)
+Mantém índices por e-mail e card_id carregados na inicialização e atualizados em segundo plano,
+para que o login não dependa de uma varredura da tabela de usuários do Pipefy a cada tentativa.
+
+Uma versão compartilhada no Redis avisa os outros workers quando esta API altera um usuário
+(ex.: troca de senha); quem vê uma versão diferente da sua recarrega o diretório.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from .models import User
+from .storage import storage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+USER_DIRECTORY_REFRESH_INTERVAL = int(os.getenv("USER_DIRECTORY_REFRESH_INTERVAL", "300"))  # 5 minutos
+# Intervalo mínimo entre recargas disparadas por e-mail não encontrado (evita varreduras em rajadas de login)
+USER_DIRECTORY_MISS_REFRESH_INTERVAL = int(os.getenv("USER_DIRECTORY_MISS_REFRESH_INTERVAL", "30"))
+
+USER_DIRECTORY_VERSION_KEY = "user_directory:version"
+# Segundos sem consultar a versão compartilhada (mesmo papel do CACHE_L1_CHECK_INTERVAL do cache)
+USER_DIRECTORY_VERSION_CHECK_INTERVAL = float(os.getenv("USER_DIRECTORY_VERSION_CHECK_INTERVAL", "1.0"))
+
+UsersLoader = Callable[[], Awaitable[Dict[int, User]]]
+
+
+class UserDirectory:
+    """Usuários indexados por id, e-mail e card_id. As buscas não fazem I/O."""
+
+    def __init__(self, loader: UsersLoader):
+        self._loader = loader
+        self._by_id: Dict[int, User] = {}
+        self._by_email: Dict[str, User] = {}
+        self._by_card_id: Dict[int, User] = {}
+        self._last_attempt = 0.0
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._background: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._by_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _index(self, users: Dict[int, User]):
+        # Monta os índices novos e troca de uma vez: leitores nunca veem um índice pela metade
+        by_email = {user.email: user for user in users.values() if user.email}
+        by_card_id = {user.card_id: user for user in users.values() if user.card_id}
+        self._by_id, self._by_email, self._by_card_id = dict(users), by_email, by_card_id
+
+    def _apply(self, users: Dict[int, User]):
+        added = users.keys() - self._by_id.keys()
+        removed = self._by_id.keys() - users.keys()
+        changed = [user_id for user_id in users.keys() & self._by_id.keys() if users[user_id] != self._by_id[user_id]]
+        if added or removed or changed or not self.loaded:
+            self._index(users)
+            logger.info(
+                f"Diretório de usuários atualizado: {len(users)} usuários "
+                f"(+{len(added)} ~{len(changed)} -{len(removed)})"
+            )
+
+    async def _load(self) -> bool:
+        self._last_attempt = time.monotonic()
+        # Lida antes da varredura: uma alteração publicada durante a recarga dispara outra
+        version = await _read_shared_version()
+        users = await self._loader()
+        if not users:
+            # O loader devolve {} em caso de erro: mantém o índice anterior
+            logger.warning("Diretório de usuários: recarga sem resultados, mantendo os dados atuais")
+            return False
+        self._apply(users)
+        self._version = version
+        self._version_checked_at = time.monotonic()
+        return True
+
+    def refresh(self) -> asyncio.Task:
+        """Recarrega os usuários; chamadas simultâneas compartilham a mesma recarga"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._load())
+        return self._refreshing
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(USER_DIRECTORY_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar diretório de usuários: {e}")
+
+    async def start(self) -> bool:
+        """Carga inicial + atualização periódica em segundo plano"""
+        loaded = await self.refresh()
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self._refresh_loop())
+        return loaded
+
+    async def stop(self):
+        for task in (self._background, self._refreshing):
+            if task is not None and not task.done():
+                task.cancel()
+        self._background = None
+        self._refreshing = None
+
+    def get_by_id(self, user_id: int) -> Optional[User]:
+        return self._by_id.get(int(user_id))
+
+    def get_by_email(self, email: str) -> Optional[User]:
+        # Comparação exata, como a busca original na tabela do Pipefy
+        return self._by_email.get(email)
+
+    def get_by_card_id(self, card_id: int) -> Optional[User]:
+        return self._by_card_id.get(int(card_id))
+
+    async def ensure_current(self):
+        """Recarrega se outro worker publicou uma alteração (no máximo uma consulta ao Redis por intervalo)"""
+        now = time.monotonic()
+        if now - self._version_checked_at < USER_DIRECTORY_VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked_at = now
+        version = await _read_shared_version()
+        if version and version != self._version:
+            await self.refresh()
+
+    async def find_by_email(self, email: str) -> Optional[User]:
+        """
+        Busca por e-mail. Se não encontrar (ex.: usuário recém-cadastrado), recarrega o diretório,
+        no máximo uma vez a cada USER_DIRECTORY_MISS_REFRESH_INTERVAL segundos.
+        """
+        await self.ensure_current()
+        user = self.get_by_email(email)
+        if user is not None:
+            return user
+        if await self._refresh_rate_limited():
+            user = self.get_by_email(email)
+        return user
+
+    async def revalidate_by_email(self, email: str) -> Optional[User]:
+        """
+        Recarrega e devolve o usuário quando o dado em memória pode estar velho (ex.: senha alterada
+        fora desta API), com o mesmo limite de USER_DIRECTORY_MISS_REFRESH_INTERVAL. Retorna None se
+        não houve recarga.
+        """
+        if await self._refresh_rate_limited():
+            return self.get_by_email(email)
+        return None
+
+    async def _refresh_rate_limited(self) -> bool:
+        if self.loaded and time.monotonic() - self._last_attempt < USER_DIRECTORY_MISS_REFRESH_INTERVAL:
+            return False
+        await self.refresh()
+        return True
+
+    def update_user(self, user: User):
+        """Atualiza um usuário nos índices após uma escrita feita por esta API (write-through)"""
+        users = dict(self._by_id)
+        users[int(user.id)] = user
+        self._index(users)
+
+    async def publish_change(self):
+        """Publica uma nova versão compartilhada para que os outros workers recarreguem o diretório"""
+        previous = await _read_shared_version()
+        version = uuid.uuid4().hex
+        try:
+            await storage.set(USER_DIRECTORY_VERSION_KEY, version)
+        except Exception as e:
+            logger.error(f"Erro ao publicar versão do diretório de usuários: {e}")
+            return
+        # Este worker já aplicou a alteração; só adota a versão nova se não havia outra pendente
+        if previous == self._version:
+            self._version = version
+
+
+async def _read_shared_version() -> Optional[str]:
+    try:
+        return await storage.get(USER_DIRECTORY_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Erro ao ler versão do diretório de usuários: {e}")
+        return None
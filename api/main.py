@@ -1,14 +1,15 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.encoders import jsonable_encoder
-from upstash_redis import Redis
 import os
 import warnings
 from dotenv import load_dotenv
 import secrets
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 
 # Carregar variáveis de ambiente primeiro
 load_dotenv()
@@ -16,17 +17,28 @@ load_dotenv()
 
 # Imports relativos corretos
 from .lib.models import *
+from .lib.pipefy_client import start_pipefy_client, close_pipefy_client, get_pipefy_client
+from .lib import cache
+from .lib.storage import storage, close_storage
+from .lib.openai_client import run_until_disconnect, close_openai_client
+from .lib.sse import sse_response
+from .lib.cpu_pool import cpu_pool_stats, close_cpu_pool
+from .lib.pipefy_scheduler import BACKGROUND, pipefy_lane, pipefy_scheduler_stats
+from .lib.responses import cached_json_response, json_response
 from .scripts.courses import *
 from .scripts.login import *
 from .scripts.g2_cursos import *
+from .scripts.course_index import CourseQuery, build_course_index, course_sort_key, query_courses
 from .scripts.chatbot import (
     ChatbotMessageRequest,
     process_chatbot_message,
+    stream_chatbot_message,
     get_conversation_history,
     clear_conversation_history
 )
 from .scripts.chatbotYmed import (
     process_chatbot_message as process_ymed_message,
+    stream_chatbot_message as stream_ymed_message,
     get_conversation_history as get_ymed_history,
     clear_conversation_history as clear_ymed_history
 )
@@ -79,11 +91,12 @@ async def lifespan(app: FastAPI):
             logger.error(f"Variáveis de ambiente obrigatórias não encontradas: {missing_vars}")
             raise RuntimeError(f"Variáveis de ambiente obrigatórias não encontradas: {missing_vars}")
         
-        # Inicializa os usuários do Pipefy
-        global users
+        # Pool de conexões compartilhado com o Pipefy
+        await start_pipefy_client()
+
+        # Inicializa o diretório de usuários do Pipefy (atualizado em segundo plano)
         logger.info("Buscando usuários do Pipefy...")
-        users = await fetch_users_from_pipefy()
-        if not users:
+        if not await user_directory.start():
             logger.error("Erro ao buscar usuários do Pipefy")
             raise RuntimeError("Erro ao buscar usuários do Pipefy")
         
@@ -93,6 +106,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Erro durante a inicialização: {str(e)}")
         raise
+    finally:
+        await user_directory.stop()
+        await close_pipefy_client()
+        await close_storage()
+        await close_openai_client()
+        close_cpu_pool()
 
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 if os.getenv("ENVIRONMENT") == "development":
@@ -112,38 +131,28 @@ app.add_middleware(
     allow_origins=["*"],  # Permitir todas as origens
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Cursor"],
 )
 
-# Verificar conexão com Redis
-try:
-    redis = Redis.from_env()
-    logger.info("Conexão com Redis estabelecida com sucesso")
-except Exception as e:
-    logger.error(f"Erro ao conectar com Redis: {str(e)}")
-    raise
+# Conexão com Redis (assíncrona, compartilhada por todos os módulos)
+logger.info(f"Backend de storage: {storage.backend}")
+
+def reorder_record(record: dict, field_order: list) -> dict:
+    ordered = {k: record[k] for k in field_order if k in record}
+    for k in record:
+        if k not in ordered:
+            ordered[k] = record[k]
+    return ordered
 
 def sort_and_reorder_dict(raw: dict, field_order: list) -> dict:
     """
     Ordena o dict pela chave (A-Z) e reordena os campos internos conforme field_order.
     Suporta chaves str ou int.
     """
-    def reorder(item: dict) -> dict:
-        ordered = {k: item[k] for k in field_order if k in item}
-        for k in item:
-            if k not in ordered:
-                ordered[k] = item[k]
-        return ordered
-
-    # Sort keys, handling both str and int
-    def sort_key(k):
-        # Try to convert to int for sorting, fallback to str
-        try:
-            return (0, int(k))
-        except (ValueError, TypeError):
-            return (1, str(k).lower())
 
-    sorted_by_key = dict(sorted(raw.items(), key=lambda kv: sort_key(kv[0])))
-    return {k: reorder(v) for k, v in sorted_by_key.items()}
+    # Numéricas primeiro, depois alfabética (mesma chave usada pelo cursor das listagens)
+    sorted_by_key = dict(sorted(raw.items(), key=lambda kv: course_sort_key(kv[0])))
+    return {k: reorder_record(v, field_order) for k, v in sorted_by_key.items()}
 
 @app.get("/")
 async def root():
@@ -158,7 +167,7 @@ async def health_check():
         logger.info(f"Testando DNS para OpenAI: {os.getenv('OPENAI_API_KEY')}")
         logger.info(f"Testando DNS para Pipefy: {os.getenv('PIPEFY_API_URL')}")
         # Verificar conexão com Redis
-        redis.ping()
+        await storage.ping()
         logger.info("Ping Redis OK")
         # Verificar OpenAI
         openai_status = bool(os.getenv("OPENAI_API_KEY"))
@@ -185,7 +194,9 @@ async def health_check():
             "redis_connection": "ok",
             "openai_available": openai_status,
             "env_variables": env_status,
-            "chatbot_ready": all(env_status.values())
+            "chatbot_ready": all(env_status.values()),
+            "cpu_pool": cpu_pool_stats(),
+            "pipefy_scheduler": pipefy_scheduler_stats()
         }
     except Exception as e:
         import socket
@@ -201,8 +212,12 @@ async def health_check():
         raise HTTPException(status_code=500, detail=f"Health check falhou: {str(e)}")
 
 # Auth Functions
+async def load_users_data() -> dict:
+    # Levanta em caso de falha: o cache mantém o último dataset bom em vez de gravar {}
+    return jsonable_encoder(await load_users_from_pipefy())
+
 @app.get("/api/users")
-async def get_users(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def get_users(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), request: Request = None):
     field_order = [
         "id",
         "nome",
@@ -211,14 +226,9 @@ async def get_users(credentials: HTTPBasicCredentials = Depends(verify_basic_aut
         "permissao",
         "card_id"
     ]
-    cache_key = "users_data"
-    cached_data = redis.json.get(cache_key)
-    if cached_data:
-        users = cached_data[0]
-        return sort_and_reorder_dict(users, field_order)
-    users = jsonable_encoder(await fetch_users_from_pipefy())
-    redis.json.set(cache_key, value=users, path="$", nx=True)
-    return sort_and_reorder_dict(users, field_order)
+    return await cached_json_response(
+        "users_data", load_users_data, lambda users: sort_and_reorder_dict(users, field_order), request=request
+    )
 
 @app.post("/api/login")
 async def validate_login(payload: LoginRequest):
@@ -251,7 +261,7 @@ async def user_forgot_password(payload: ForgotPasswordRequest):
 
 @app.post("/api/verify-password")
 async def verify_user_password(payload: VerifyPasswordRequest):
-    return verify_password(payload.password, payload.hashed_password)
+    return await verify_password(payload.password, payload.hashed_password)
 
 @app.post("/api/verify-reset-code")
 async def verify_code(payload: VerifyResetCodeRequest):
@@ -259,21 +269,50 @@ async def verify_code(payload: VerifyResetCodeRequest):
 
 # Course Functions
 @app.post("/update-course-status")
-async def update_course_status_after_comite(payload: CourseUpdate, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def update_course_status_after_comite(payload: CourseUpdate, background_tasks: BackgroundTasks, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     course = CourseUpdate(
         courseId=str(payload.courseId),
         status=payload.status,
-        observations=payload.observations
+        observations=payload.observations,
+        is_pre_comite=payload.is_pre_comite
     )
     message = await update_course_status(course)
-    redis.json.delete("home_data")
-    await home_data()
+    try:
+        await apply_course_updates([course])
+    except Exception as e:
+        # O Pipefy já foi atualizado: ressincroniza em segundo plano, sem segurar a resposta numa varredura
+        logger.error(f"Erro ao atualizar caches após mudança de status do curso {course.courseId}: {e}")
+        background_tasks.add_task(resync_course_caches)
     return message
 
+COURSE_UPDATE_BULK_MAX = int(os.getenv("COURSE_UPDATE_BULK_MAX", "200"))
+
+@app.post("/update-course-status/bulk")
+async def update_course_status_bulk_after_comite(payload: List[CourseUpdate], background_tasks: BackgroundTasks, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    """Registra várias decisões do comitê de uma vez; o resultado de cada item vem na ordem recebida"""
+    if not payload:
+        raise HTTPException(status_code=400, detail="Nenhuma atualização enviada")
+    if len(payload) > COURSE_UPDATE_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo de {COURSE_UPDATE_BULK_MAX} atualizações por requisição")
+    courses = [course.model_copy(update={"courseId": str(course.courseId)}) for course in payload]
+    results = await update_course_status_bulk(courses)
+    # Caches e contadores da home corrigidos de uma vez, só com o que o Pipefy confirmou
+    confirmed = [course for course, result in zip(courses, results) if result["success"]]
+    try:
+        await apply_course_updates(confirmed)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar caches após atualização em lote: {e}")
+        background_tasks.add_task(resync_course_caches)
+    return {
+        "success": len(confirmed) == len(courses),
+        "updated": len(confirmed),
+        "failed": len(courses) - len(confirmed),
+        "results": results,
+    }
+
 @app.get("/diagnostic/pipefy")
 async def diagnose_pipefy_connection(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     """Endpoint de diagnóstico para verificar conexão com Pipefy"""
-    import httpx
     try:
         api_url = "https://api.pipefy.com/graphql"
         pipefy_key = os.getenv("PIPEFY_SERVICE_ACCOUNT_SECRET")
@@ -291,18 +330,18 @@ async def diagnose_pipefy_connection(credentials: HTTPBasicCredentials = Depends
             "Content-Type": "application/json",
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                api_url,
-                headers=headers,
-                json={"query": test_query}
-            )
-            
-            return {
-                "status": "ok" if response.is_success else "error",
-                "http_status": response.status_code,
-                "response": response.text[:500] if response.text else "No response"
-            }
+        response = await get_pipefy_client().post(
+            api_url,
+            headers=headers,
+            json={"query": test_query},
+            timeout=10.0
+        )
+
+        return {
+            "status": "ok" if response.is_success else "error",
+            "http_status": response.status_code,
+            "response": response.text[:500] if response.text else "No response"
+        }
     except Exception as e:
         logger.error(f"Erro ao diagnosticar Pipefy: {str(e)}")
         return {
@@ -310,119 +349,356 @@ async def diagnose_pipefy_connection(credentials: HTTPBasicCredentials = Depends
             "message": str(e)
         }
     
+UNYLEYA_FIELD_ORDER = [
+    "id", "fase", "entity", "slug", "nome", "coordenadorSolicitante", "coordenadores",
+    "apresentacao", "publico", "concorrentesIA", "performance",
+    "videoUrl", "disciplinasIA", "status", "observacoesComite", "cargaHoraria"
+]
+
+YMED_FIELD_ORDER = [
+    "id", "entity", "slug", "nomeDoCurso", "coordenador", "justificativaIntroducao",
+    "lacunaFormacaoGap", "propostaCurso", "publicoAlvo", "conteudoProgramatico",
+    "mercado", "diferencialCurso", "observacoesGerais", "status", "observacoesComite",
+    "performance", "concorrentes"
+]
+
+HOME_FIELD_ORDER = [
+    "active_projects",
+    "coordinators",
+    "rejected",
+    "approved",
+    "pendent",
+    "standby",
+    "total_proposals",
+    "unyleya_proposals",
+    "ymed_proposals"
+]
+
+COURSE_FIELD_ORDERS = {
+    "courses_data": UNYLEYA_FIELD_ORDER,
+    "pre_comite_courses_data": UNYLEYA_FIELD_ORDER,
+    "ymed_courses_data": YMED_FIELD_ORDER,
+}
+
+# Datasets que entram nos contadores da home
+HOME_COURSE_KEYS = ("courses_data", "ymed_courses_data")
+
+# Sincronização incremental dos cursos: margem contra diferença de relógio e intervalo entre varreduras completas
+COURSES_SYNC_OVERLAP = int(os.getenv("COURSES_SYNC_OVERLAP", "60"))
+COURSES_FULL_SYNC_INTERVAL = int(os.getenv("COURSES_FULL_SYNC_INTERVAL", str(6 * 60 * 60)))
+
+def full_sync_result(raw: dict, field_order: list, started: datetime) -> cache.LoadResult:
+    return cache.LoadResult(
+        sort_and_reorder_dict(raw, field_order),
+        {"synced_at": started.isoformat(), "full_synced_at": started.timestamp()}
+    )
+
+def merge_phase_delta(cached: dict, delta: PhaseDelta) -> dict:
+    """Aplica o delta ao dict em cache (chave = slug): remove cards que saíram da fase e substitui os alterados"""
+    slug_by_id = {str(course.get("id")): slug for slug, course in cached.items()}
+    merged = {slug: course for slug, course in cached.items() if str(course.get("id")) in delta.card_ids}
+    for card_id, course in delta.changed.items():
+        old_slug = slug_by_id.get(card_id)
+        if old_slug is not None and old_slug != course.slug:
+            merged.pop(old_slug, None)
+        merged[course.slug] = jsonable_encoder(course)
+    return merged
+
+async def load_incremental(key: str, field_order: list, full_loader, delta_loader) -> cache.LoadResult:
+    """
+    Mescla no cache apenas os cards alterados desde a última sincronização.
+    Faz a varredura completa quando não há estado anterior ou a última completa é antiga.
+    """
+    cached, meta = await cache.peek(key)
+    meta = meta or {}
+    synced_at = meta.get("synced_at")
+    full_synced_at = meta.get("full_synced_at", 0)
+    if cached is None or not synced_at or time.time() - full_synced_at > COURSES_FULL_SYNC_INTERVAL:
+        return await full_loader()
+
+    started = datetime.now(timezone.utc)
+    since = (datetime.fromisoformat(synced_at) - timedelta(seconds=COURSES_SYNC_OVERLAP)).isoformat()
+    # Cards sem curso já buscados contam como conhecidos: só voltam a ser buscados quando alterados
+    unparsed_ids = set(meta.get("unparsed_ids", []))
+    known_ids = {str(course.get("id")) for course in cached.values()} | unparsed_ids
+    delta = await delta_loader(since, known_ids)
+    if delta is None:
+        return await full_loader()
+
+    merged = merge_phase_delta(cached, delta)
+    unparsed_ids = ((unparsed_ids & delta.card_ids) - delta.changed.keys()) | delta.unparsed
+    logger.info(f"Cache {key}: sync incremental aplicada ({len(delta.changed)} alterados, {len(merged)} cursos)")
+    return cache.LoadResult(
+        sort_and_reorder_dict(merged, field_order),
+        {"synced_at": started.isoformat(), "full_synced_at": full_synced_at, "unparsed_ids": sorted(unparsed_ids)}
+    )
+
+# Loaders usados pelo cache para reconstruir cada chave a partir do Pipefy
+async def load_courses_unyleya() -> cache.LoadResult:
+    logger.info("Buscando cursos da API Pipefy")
+    started = datetime.now(timezone.utc)
+    raw = jsonable_encoder(await get_courses_unyleya())
+    logger.info(f"Encontrados {len(raw)} cursos")
+    return full_sync_result(raw, UNYLEYA_FIELD_ORDER, started)
+
+async def load_courses_pre_comite() -> cache.LoadResult:
+    logger.info("Buscando cursos pré-comitê da API Pipefy")
+    started = datetime.now(timezone.utc)
+    raw = jsonable_encoder(await get_courses_pre_comite())
+    logger.info(f"Encontrados {len(raw)} cursos pré-comitê")
+    return full_sync_result(raw, UNYLEYA_FIELD_ORDER, started)
+
+async def load_courses_ymed() -> cache.LoadResult:
+    logger.info("Buscando cursos YMED da API Pipefy")
+    started = datetime.now(timezone.utc)
+    raw = jsonable_encoder(await get_courses_ymed())
+    logger.info(f"Encontrados {len(raw)} cursos YMED")
+    return full_sync_result(raw, YMED_FIELD_ORDER, started)
+
+async def sync_courses_unyleya() -> cache.LoadResult:
+    return await load_incremental("courses_data", UNYLEYA_FIELD_ORDER, load_courses_unyleya, get_courses_unyleya_delta)
+
+async def sync_courses_pre_comite() -> cache.LoadResult:
+    return await load_incremental("pre_comite_courses_data", UNYLEYA_FIELD_ORDER, load_courses_pre_comite, get_courses_pre_comite_delta)
+
+async def sync_courses_ymed() -> cache.LoadResult:
+    return await load_incremental("ymed_courses_data", YMED_FIELD_ORDER, load_courses_ymed, get_courses_ymed_delta)
+
+async def load_home_data() -> dict:
+    """
+    Agrega os contadores da home a partir dos cursos em cache (Unyleya comitê + YMED).
+    Só os datasets ausentes são carregados, em paralelo.
+    """
+    unyleya, ymed = await asyncio.gather(
+        cache.get_or_load("courses_data", sync_courses_unyleya),
+        cache.get_or_load("ymed_courses_data", sync_courses_ymed)
+    )
+    return build_home_data(unyleya.values(), ymed.values())
+
+async def refresh_home_from_caches():
+    """Recalcula os contadores da home a partir dos cursos em cache (sem consultar o Pipefy)"""
+    home, _ = await cache.peek("home_data")
+    if home is None:
+        return
+    unyleya, _ = await cache.peek("courses_data")
+    ymed, _ = await cache.peek("ymed_courses_data")
+    if unyleya is None or ymed is None:
+        return
+    await cache.write("home_data", build_home_data(unyleya.values(), ymed.values()))
+
+async def apply_home_status_changes(changes: List[Tuple[Optional[str], Optional[str]]]):
+    """Atualiza os contadores da home por delta após mudanças de status (antigo, novo) de cursos"""
+    home, _ = await cache.peek("home_data")
+    if home is None or not changes:
+        return
+    updated = home
+    for old_status, new_status in changes:
+        updated = apply_status_delta(updated, old_status, new_status)
+    if updated != home:
+        await cache.write("home_data", updated)
+
+# Campos do curso em cache alterados por uma decisão, por etapa (pré-comitê ou comitê)
+COURSE_STATUS_FIELDS = {
+    True: ("statusPreComite", "observacoesPreComite"),
+    False: ("status", "observacoesComite"),
+}
+
+def patch_course_record(record: dict, update: CourseUpdate) -> dict:
+    status_field, observations_field = COURSE_STATUS_FIELDS[update.is_pre_comite]
+    patched = {**record, status_field: update.status}
+    if update.observations is not None:
+        patched[observations_field] = update.observations
+    return patched
+
+async def resync_course_caches():
+    """Sincroniza os cursos em segundo plano (incremental, single-flight) e depois recalcula a home"""
+    await asyncio.gather(
+        *(cache.schedule_refresh(key, loader) for key, loader in COURSE_CACHES), return_exceptions=True
+    )
+    await refresh_home_from_caches()
+
+async def apply_course_updates(updates: List[CourseUpdate]):
+    """
+    Write-through após decisões confirmadas pelo Pipefy: corrige os cursos em cada cache onde aparecem
+    (uma versão nova por chave) e os contadores da home por delta, sem nova varredura
+    """
+    pending = {str(update.courseId): update for update in updates}
+    status_changes = []
+    for key, _ in COURSE_CACHES:
+        cached, _ = await cache.peek(key)
+        patches = {}
+        for slug, record in (cached or {}).items():
+            update = pending.get(str(record.get("id")))
+            if update is None:
+                continue
+            patches[slug] = patch_course_record(record, update)
+            # A home só conta o status pós-comitê (comitê Unyleya + YMED)
+            if key in HOME_COURSE_KEYS and not update.is_pre_comite:
+                status_changes.append((record.get("status"), update.status))
+        if patches:
+            await cache.set_members(key, patches)
+    await apply_home_status_changes(status_changes)
+
+async def list_courses(key: str, loader, field_order: list, query: CourseQuery, request: Optional[Request] = None):
+    """
+    Listagem completa (comportamento original) ou, com filtros/projeção/limit, consulta nos índices
+    secundários do cache. O total filtrado e o cursor da próxima página vão nos headers.
+    """
+    if query.is_empty():
+        # Bytes já ordenados e serializados, calculados uma vez por versão do cache
+        return await cached_json_response(key, loader, lambda raw: sort_and_reorder_dict(raw, field_order), request=request)
+
+    index, _ = await cache.get_view(key, loader, "course_index", build_course_index)
+    page, next_cursor, total = query_courses(index, query, field_order)
+    headers = {"X-Total-Count": str(total)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return json_response(page, request, headers)
+
 @app.get("/courses")
-async def get_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def get_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), query: CourseQuery = Depends(), request: Request = None):
     try:
-        cache_key = "courses_data"
-        field_order = [
-            "id", "fase", "entity", "slug", "nome", "coordenadorSolicitante", "coordenadores",
-            "apresentacao", "publico", "concorrentesIA", "performance",
-            "videoUrl", "disciplinasIA", "status", "observacoesComite", "cargaHoraria"
-        ]
         logger.info("Buscando dados de cursos Unyleya")
-        cached = redis.json.get(cache_key)
-        if cached:
-            logger.info("Retornando cursos do cache")
-            raw = cached[0]
-            return sort_and_reorder_dict(raw, field_order)
-        logger.info("Buscando cursos da API Pipefy")
-        raw = jsonable_encoder(await get_courses_unyleya())
-        logger.info(f"Encontrados {len(raw)} cursos")
-        ordered = sort_and_reorder_dict(raw, field_order)
-        redis.json.set(cache_key, path="$", value=ordered, nx=True)
-        return ordered
+        return await list_courses("courses_data", sync_courses_unyleya, UNYLEYA_FIELD_ORDER, query, request)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar cursos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar cursos: {str(e)}")
 
 @app.get("/pre-comite-courses")
-async def get_pre_comite_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def get_pre_comite_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), query: CourseQuery = Depends(), request: Request = None):
     try:
-        cache_key = "pre_comite_courses_data"
-        field_order = [
-            "id", "fase", "entity", "slug", "nome", "coordenadorSolicitante", "coordenadores",
-            "apresentacao", "publico", "concorrentesIA", "performance",
-            "videoUrl", "disciplinasIA", "status", "observacoesComite", "cargaHoraria"
-        ]
         logger.info("Buscando dados de cursos pré-comitê")
-        cached = redis.json.get(cache_key)
-        if cached:
-            logger.info("Retornando cursos pré-comitê do cache")
-            raw = cached[0]
-            return sort_and_reorder_dict(raw, field_order)
-        logger.info("Buscando cursos pré-comitê da API Pipefy")
-        raw = jsonable_encoder(await get_courses_pre_comite())
-        logger.info(f"Encontrados {len(raw)} cursos pré-comitê")
-        ordered = sort_and_reorder_dict(raw, field_order)
-        redis.json.set(cache_key, path="$", value=ordered, nx=True)
-        return ordered
+        return await list_courses("pre_comite_courses_data", sync_courses_pre_comite, UNYLEYA_FIELD_ORDER, query, request)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar cursos pré-comitê: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar cursos pré-comitê: {str(e)}")
 
 @app.get("/courses-ymed")
-async def get_ymed_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def get_ymed_courses_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), query: CourseQuery = Depends(), request: Request = None):
     try:
-        cache_key = "ymed_courses_data"
-        field_order = [
-            "id", "entity", "slug", "nomeDoCurso", "coordenador", "justificativaIntroducao",
-            "lacunaFormacaoGap", "propostaCurso", "publicoAlvo", "conteudoProgramatico",
-            "mercado", "diferencialCurso", "observacoesGerais", "status", "observacoesComite",
-            "performance", "concorrentes"
-        ]
         logger.info("Buscando dados de cursos YMED")
-        cached = redis.json.get(cache_key)
-        if cached:
-            logger.info("Retornando cursos YMED do cache")
-            raw = cached[0]
-            return sort_and_reorder_dict(raw, field_order)
-        logger.info("Buscando cursos YMED da API Pipefy")
-        raw = jsonable_encoder(await get_courses_ymed())
-        logger.info(f"Encontrados {len(raw)} cursos YMED")
-        ordered = sort_and_reorder_dict(raw, field_order)
-        redis.json.set(cache_key, path="$", value=ordered, nx=True)
-        return ordered
+        return await list_courses("ymed_courses_data", sync_courses_ymed, YMED_FIELD_ORDER, query, request)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar cursos YMED: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar cursos YMED: {str(e)}")
 
+# Ordem de busca de um curso nas três fases (chave de cache, loader)
+COURSE_CACHES = [
+    ("courses_data", sync_courses_unyleya),
+    ("pre_comite_courses_data", sync_courses_pre_comite),
+    ("ymed_courses_data", sync_courses_ymed),
+]
+
+@app.get("/courses/by-id/{card_id}")
+async def get_course_by_id(card_id: str, request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    """Retorna um único curso (qualquer fase) pelo id do card, usando o índice id -> slug do cache"""
+    try:
+        results = await asyncio.gather(*(cache.lookup_member(key, card_id, loader) for key, loader in COURSE_CACHES))
+    except Exception as e:
+        logger.error(f"Erro ao buscar curso {card_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar curso: {str(e)}")
+    for (key, _), found in zip(COURSE_CACHES, results):
+        if found is not None:
+            return json_response(reorder_record(found[1], COURSE_FIELD_ORDERS[key]), request)
+    raise HTTPException(status_code=404, detail="Curso não encontrado")
+
+@app.get("/courses/{slug}")
+async def get_course_by_slug(slug: str, request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    """Retorna um único curso (qualquer fase) pelo slug, lendo só esse item do cache"""
+    try:
+        results = await asyncio.gather(*(cache.get_member(key, slug, loader) for key, loader in COURSE_CACHES))
+    except Exception as e:
+        logger.error(f"Erro ao buscar curso {slug}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar curso: {str(e)}")
+    for (key, _), course in zip(COURSE_CACHES, results):
+        if course is not None:
+            return json_response(reorder_record(course, COURSE_FIELD_ORDERS[key]), request)
+    raise HTTPException(status_code=404, detail="Curso não encontrado")
+
+def order_home_data(raw: dict) -> dict:
+    ordered = {k: raw[k] for k in HOME_FIELD_ORDER if k in raw}
+    for k in raw:
+        if k not in ordered:
+            ordered[k] = raw[k]
+    return ordered
+
 @app.get("/home-data")
-async def home_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def home_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), request: Request = None):
     """
     Retorna dados agregados para a home, com tratamento de erro robusto e nomes de campos alinhados.
     """
-    redis_key = "home_data"
-    field_order = [
-        "active_projects",
-        "coordinators",
-        "rejected",
-        "approved",
-        "pendent",
-        "standby",
-        "total_proposals",
-        "unyleya_proposals",
-        "ymed_proposals"
-    ]
     try:
-        cached_data = redis.json.get(redis_key)
-        if cached_data:
-            raw = cached_data[0]
-            ordered = {k: raw[k] for k in field_order if k in raw}
-            for k in raw:
-                if k not in ordered:
-                    ordered[k] = raw[k]
-            return ordered
-        home_data_dict = await get_home_data()
-        redis.json.set(redis_key, value=home_data_dict, path="$", nx=True)
-        ordered = {k: home_data_dict[k] for k in field_order if k in home_data_dict}
-        for k in home_data_dict:
-            if k not in ordered:
-                ordered[k] = home_data_dict[k]
-        return ordered
+        return await cached_json_response("home_data", load_home_data, order_home_data, request=request)
     except Exception as e:
         logger.error(f"Erro ao buscar dados da home: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao buscar dados da home: {str(e)}")
 
+# Webhooks do Pipefy: mantêm o cache dos cursos atualizado sem varrer as fases
+# Segredo enviado pelo Pipefy no header X-Webhook-Token; sem ele o endpoint fica desligado (503)
+PIPEFY_WEBHOOK_TOKEN = os.getenv("PIPEFY_WEBHOOK_TOKEN")
+PIPEFY_WEBHOOK_ACTIONS = {"card.create", "card.field_update", "card.move", "card.delete"}
+
+async def apply_card_to_caches(card_id: str, deleted: bool = False):
+    """
+    Atualiza um único card no cache: grava-o na chave da fase em que está agora
+    e o remove das demais (movimentação entre fases, exclusão ou saída das fases acompanhadas).
+    """
+    node = None if deleted else await fetch_course_card(card_id)
+    phase = COURSE_PHASES.get(str(((node or {}).get("current_phase") or {}).get("id")))
+
+    course = None
+    if phase is not None:
+        try:
+            course = phase.parse_node(node)
+        except Exception as e:
+            logger.error(f"Webhook: erro ao processar card {card_id}: {e}")
+            return
+
+    for key, field_order in COURSE_FIELD_ORDERS.items():
+        if not await cache.is_cached(key):
+            # Sem cache para a chave: a próxima leitura já busca o estado atual
+            continue
+        new_slug = course.slug if course is not None and phase.cache_key == key else None
+        # Slug atual do card pelo índice id -> slug, sem baixar o dataset inteiro
+        old_slug = await cache.find_member(key, card_id)
+        if old_slug is not None and old_slug != new_slug:
+            await cache.delete_member(key, old_slug)
+        if new_slug:
+            await cache.set_member(key, new_slug, reorder_record(jsonable_encoder(course), field_order))
+            logger.info(f"Webhook: card {card_id} atualizado em {key}")
+
+    await refresh_home_from_caches()
+
+async def process_pipefy_webhook(action: str, card_id: str):
+    try:
+        with pipefy_lane(BACKGROUND):
+            await apply_card_to_caches(card_id, deleted=(action == "card.delete"))
+    except Exception as e:
+        logger.error(f"Webhook: erro ao aplicar {action} do card {card_id}: {e}")
+
+@app.post("/webhooks/pipefy")
+async def pipefy_webhook(payload: PipefyWebhook, background_tasks: BackgroundTasks, x_webhook_token: Optional[str] = Header(None)):
+    if not PIPEFY_WEBHOOK_TOKEN:
+        # Sem token configurado o webhook fica desligado: cada evento consome requisições do Pipefy
+        raise HTTPException(status_code=503, detail="Webhook não configurado.")
+    if not secrets.compare_digest(x_webhook_token or "", PIPEFY_WEBHOOK_TOKEN):
+        raise HTTPException(status_code=401, detail="Acesso negado.")
+
+    action = payload.data.get("action")
+    card_id = (payload.data.get("card") or {}).get("id")
+    if action not in PIPEFY_WEBHOOK_ACTIONS or not card_id:
+        return {"received": True, "ignored": True}
+
+    # Responde logo: o Pipefy reenvia o evento se o webhook demorar
+    background_tasks.add_task(process_pipefy_webhook, action, str(card_id))
+    return {"received": True}
+
 @app.get("/get-card-comments")
 async def get_card_comments(card_id: int, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     return await get_card_comments_data(card_id=card_id)
@@ -433,51 +709,52 @@ async def create_card_comment(card_id: int, text: str, credentials: HTTPBasicCre
 
 # Refresh Functions
 @app.get("/refresh-courses-unyleya")
-async def refresh_courses_unyleya(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    """Clear cached course data and fetch fresh information."""
-    redis.json.delete("courses_data")
-    return await get_courses_data()
+async def refresh_courses_unyleya(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), incremental: bool = False):
+    """Rebuild cached course data with fresh information (only changed cards with ?incremental=true)."""
+    await cache.refresh("courses_data", sync_courses_unyleya if incremental else load_courses_unyleya)
+    return await get_courses_data(credentials, CourseQuery())
 
 @app.get("/refresh-courses-pre-comite")
-async def refresh_courses_pre_comite(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    """Clear cached pre-comite course data and fetch fresh information."""
-    redis.json.delete("pre_comite_courses_data")
-    return await get_pre_comite_courses_data(credentials)
+async def refresh_courses_pre_comite(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), incremental: bool = False):
+    """Rebuild cached pre-comite course data with fresh information (only changed cards with ?incremental=true)."""
+    await cache.refresh("pre_comite_courses_data", sync_courses_pre_comite if incremental else load_courses_pre_comite)
+    return await get_pre_comite_courses_data(credentials, CourseQuery())
 
 @app.get("/refresh-courses-ymed")
-async def refresh_courses_ymed(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    """Clear cached course data and fetch fresh information."""
-    redis.json.delete("ymed_courses_data")
-    return await get_ymed_courses_data()
+async def refresh_courses_ymed(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), incremental: bool = False):
+    """Rebuild cached course data with fresh information (only changed cards with ?incremental=true)."""
+    await cache.refresh("ymed_courses_data", sync_courses_ymed if incremental else load_courses_ymed)
+    return await get_ymed_courses_data(credentials, CourseQuery())
 
 @app.get("/refresh-home-data")
 async def refresh_home_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    """Clear cached home data and fetch fresh information."""
-    redis.json.delete("home_data")
+    """Rebuild cached home data with fresh information."""
+    await cache.refresh("home_data", load_home_data)
     return await home_data()
 
 @app.get("/refresh-users")
 async def refresh_users(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    """Clear cached users data and fetch fresh information."""
-    redis.json.delete("users_data")
+    """Rebuild cached users data with fresh information."""
+    await asyncio.gather(cache.refresh("users_data", load_users_data), user_directory.refresh())
     return await get_users()
 
 @app.get("/refresh-data")
-async def refresh_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def refresh_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth), incremental: bool = False):
     """Clear cached data."""
     await asyncio.gather(
-        refresh_courses_unyleya(credentials),
-        refresh_courses_pre_comite(credentials),
-        refresh_courses_ymed(credentials),
-        refresh_home_data(credentials),
+        refresh_courses_unyleya(credentials, incremental),
+        refresh_courses_pre_comite(credentials, incremental),
+        refresh_courses_ymed(credentials, incremental),
         refresh_users(credentials)
     )
+    # A home é derivada dos cursos em cache: só depois que eles foram atualizados
+    await refresh_home_data(credentials)
     return {"message": "Dados atualizados com sucesso."}
 
 # Cursos G2 Functions
 @app.get("/g2/cursos-g2")
-async def get_cursos_g2_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    return await get_cursos_g2()
+async def get_cursos_g2_data(request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    return await get_cursos_g2(request)
 
 @app.get("/g2/cursos-g2-excel")
 async def get_cursos_g2_excel_file(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
@@ -485,22 +762,30 @@ async def get_cursos_g2_excel_file(credentials: HTTPBasicCredentials = Depends(v
 
 # Cursos Search Functions
 @app.get("/g2/cursos-search")
-async def get_cursos_search_data(credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
-    return await get_cursos_search()
+async def get_cursos_search_data(request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    return await get_cursos_search(request)
 
 # Chatbot Functions (Normal)
 @app.post("/chatbot/message")
-async def send_chatbot_message(payload: ChatbotMessageRequest, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def send_chatbot_message(payload: ChatbotMessageRequest, request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     """Processar mensagem do chatbot"""
     try:
         logger.info(f"Recebendo mensagem do chatbot: user_id={payload.user_id}")
-        result = await process_chatbot_message(payload.message, payload.user_id)
+        result = await run_until_disconnect(request, process_chatbot_message(payload.message, payload.user_id))
         logger.info(f"Mensagem processada com sucesso para user_id={payload.user_id}")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao processar mensagem do chatbot: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem: {str(e)}")
 
+@app.post("/chatbot/message/stream")
+async def stream_chatbot_message_sse(payload: ChatbotMessageRequest, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    """Processar mensagem do chatbot enviando a resposta em streaming (SSE)"""
+    logger.info(f"Recebendo mensagem do chatbot (stream): user_id={payload.user_id}")
+    return sse_response(stream_chatbot_message(payload.message, payload.user_id))
+
 @app.get("/chatbot/history/{user_id}")
 async def get_chatbot_history(user_id: str, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     """Buscar histórico de conversas"""
@@ -541,17 +826,25 @@ async def test_unyleya_chatbot():
 
 # Chatbot Ymed Functions (usando Assistants API)
 @app.post("/chatbot-ymed/message")
-async def send_ymed_chatbot_message(payload: ChatbotMessageRequest, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+async def send_ymed_chatbot_message(payload: ChatbotMessageRequest, request: Request, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     """Processar mensagem do chatbot Ymed usando Assistants API"""
     try:
         logger.info(f"Recebendo mensagem do chatbot Ymed: user_id={payload.user_id}")
-        result = await process_ymed_message(payload.message, payload.user_id)
+        result = await run_until_disconnect(request, process_ymed_message(payload.message, payload.user_id))
         logger.info(f"Mensagem Ymed processada com sucesso para user_id={payload.user_id}")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao processar mensagem do chatbot Ymed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem Ymed: {str(e)}")
 
+@app.post("/chatbot-ymed/message/stream")
+async def stream_ymed_chatbot_message_sse(payload: ChatbotMessageRequest, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
+    """Processar mensagem do chatbot Ymed enviando a resposta em streaming (SSE)"""
+    logger.info(f"Recebendo mensagem do chatbot Ymed (stream): user_id={payload.user_id}")
+    return sse_response(stream_ymed_message(payload.message, payload.user_id))
+
 @app.get("/chatbot-ymed/history/{user_id}")
 async def get_ymed_chatbot_history(user_id: str, credentials: HTTPBasicCredentials = Depends(verify_basic_auth)):
     """Buscar histórico de conversas do chatbot Ymed"""
@@ -1,15 +1,16 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 import logging
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator
 import openai
 import json
 import uuid
-from upstash_redis import Redis
 from fastapi import HTTPException
+from ..lib.storage import storage
+from ..lib.openai_client import get_openai_client, openai_slot, OPENAI_TIMEOUT
+from ..lib.sse import format_sse
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,10 +24,6 @@ if not api_key:
     logger.error("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
     raise ValueError("OPENAI_API_KEY não configurada")
 
-client = OpenAI(api_key=api_key)
-
-# Inicializar Redis
-redis = Redis.from_env()
 
 class ChatbotMessageRequest(BaseModel):
     message: str
@@ -219,23 +216,15 @@ def format_dict_as_table(data: Dict) -> str:
         
     return table
 
-async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
+async def build_chat_messages(message: str, user_id: str) -> List[Dict[str, str]]:
     """
-    Processa uma mensagem do chatbot e retorna a resposta.
+    Monta as mensagens enviadas ao ChatGPT: prompt de sistema, histórico recente e mensagem atual.
     """
-    try:
-        logger.info(f"Processando mensagem para user_id: {user_id}")
-        
-        # Verificar se a chave da API está configurada
-        if not api_key:
-            logger.error("OPENAI_API_KEY não configurada")
-            raise HTTPException(status_code=500, detail="Chave da API OpenAI não configurada")
-        
-        # Buscar histórico de conversas do usuário
-        conversation_history = await get_conversation_history(user_id)
-        
-        # Preparar contexto para o ChatGPT
-        system_prompt = """
+    # Buscar histórico de conversas do usuário
+    conversation_history = await get_conversation_history(user_id)
+    
+    # Preparar contexto para o ChatGPT
+    system_prompt = """
         Você é um assistente virtual especializado em cursos e educação da Unyleya. 
         Você pode ajudar com informações sobre:
         - Cursos disponíveis e suas propostas
@@ -284,28 +273,45 @@ async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
         Responda de forma útil, profissional e concisa. Se você não tiver informações específicas sobre algo, seja honesto sobre isso.
         Sempre que possível, forneça análises fundamentadas com base nas informações disponíveis.
         """
-        
-        # Construir mensagens para o ChatGPT
-        messages = [{"role": "system", "content": system_prompt}]
+    
+    # Construir mensagens para o ChatGPT
+    messages = [{"role": "system", "content": system_prompt}]
 
-        # Adicionar histórico recente (últimas 2 mensagens)
-        recent_history = conversation_history.get("messages", [])[-2:]
-        for msg in recent_history:
-            messages.append({"role": "user", "content": msg["message"]})
-            messages.append({"role": "assistant", "content": msg["response"]})
+    # Adicionar histórico recente (últimas 2 mensagens)
+    recent_history = conversation_history.get("messages", [])[-2:]
+    for msg in recent_history:
+        messages.append({"role": "user", "content": msg["message"]})
+        messages.append({"role": "assistant", "content": msg["response"]})
+    
+    # Adicionar mensagem atual
+    messages.append({"role": "user", "content": message})
+    return messages
+
+async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
+    """
+    Processa uma mensagem do chatbot e retorna a resposta.
+    """
+    try:
+        logger.info(f"Processando mensagem para user_id: {user_id}")
+        
+        # Verificar se a chave da API está configurada
+        if not api_key:
+            logger.error("OPENAI_API_KEY não configurada")
+            raise HTTPException(status_code=500, detail="Chave da API OpenAI não configurada")
         
-        # Adicionar mensagem atual
-        messages.append({"role": "user", "content": message})
+        messages = await build_chat_messages(message, user_id)
         
         logger.info(f"Fazendo chamada para OpenAI com {len(messages)} mensagens")
         
-        # Fazer chamada para OpenAI usando a nova API
-        response = client.chat.completions.create(
-            model="gpt-4.1",
-            messages=messages,
-            max_tokens=2500,
-            temperature=1.0
-        )
+        # Fazer chamada assíncrona para OpenAI, limitada pelo número de vagas do worker
+        async with openai_slot():
+            response = await get_openai_client().chat.completions.create(
+                model="gpt-4.1",
+                messages=messages,
+                max_tokens=2500,
+                temperature=1.0,
+                timeout=OPENAI_TIMEOUT
+            )
         
         bot_response = response.choices[0].message.content
         logger.info(f"Resposta recebida da OpenAI: {len(bot_response)} caracteres")
@@ -325,6 +331,11 @@ async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
+    except openai.APITimeoutError as e:
+        logger.error(f"Timeout da OpenAI: {str(e)}")
+        raise HTTPException(status_code=504, detail="A OpenAI demorou demais para responder")
     except openai.OpenAIError as e:
         logger.error(f"Erro da OpenAI: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro da OpenAI: {str(e)}")
@@ -332,13 +343,68 @@ async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
         logger.error(f"Erro geral ao processar mensagem: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem: {str(e)}")
 
+async def stream_chatbot_message(message: str, user_id: str) -> AsyncIterator[str]:
+    """
+    Versão em streaming de process_chatbot_message: envia os tokens como eventos SSE
+    conforme são gerados e salva o histórico quando a resposta termina.
+    """
+    try:
+        logger.info(f"Processando mensagem (stream) para user_id: {user_id}")
+        messages = await build_chat_messages(message, user_id)
+
+        parts: List[str] = []
+        async with openai_slot():
+            stream = await get_openai_client().chat.completions.create(
+                model="gpt-4.1",
+                messages=messages,
+                max_tokens=2500,
+                temperature=1.0,
+                timeout=OPENAI_TIMEOUT,
+                stream=True
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield format_sse("token", {"content": delta})
+
+        bot_response = "".join(parts)
+        logger.info(f"Stream concluído da OpenAI: {len(bot_response)} caracteres")
+
+        if is_table_request(message):
+            bot_response = format_json_as_table(bot_response)
+
+        message_id = str(uuid.uuid4())
+        await save_message_to_history(user_id, message_id, message, bot_response)
+
+        yield format_sse("done", {
+            "success": True,
+            "message_id": message_id,
+            "response": bot_response,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except HTTPException as e:
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    except openai.APITimeoutError as e:
+        logger.error(f"Timeout da OpenAI (stream): {str(e)}")
+        yield format_sse("error", {"status_code": 504, "detail": "A OpenAI demorou demais para responder"})
+    except openai.OpenAIError as e:
+        logger.error(f"Erro da OpenAI (stream): {str(e)}")
+        yield format_sse("error", {"status_code": 500, "detail": f"Erro da OpenAI: {str(e)}"})
+    except Exception as e:
+        logger.error(f"Erro geral ao processar mensagem (stream): {str(e)}")
+        yield format_sse("error", {"status_code": 500, "detail": f"Erro ao processar mensagem: {str(e)}"})
+
 async def get_conversation_history(user_id: str) -> Dict[str, Any]:
     """
     Recupera o histórico de conversas de um usuário.
     """
     try:
         cache_key = f"chatbot_conversation_{user_id}"
-        cached_history = redis.json.get(cache_key)
+        cached_history = await storage.json_get(cache_key)
         
         if cached_history:
             return cached_history[0]
@@ -358,7 +424,7 @@ async def clear_conversation_history(user_id: str) -> Dict[str, Any]:
     """
     try:
         cache_key = f"chatbot_conversation_{user_id}"
-        redis.json.delete(cache_key)
+        await storage.json_delete(cache_key)
         
         return {
             "success": True,
@@ -393,7 +459,7 @@ async def save_message_to_history(user_id: str, message_id: str, message: str, r
             existing_history["messages"] = existing_history["messages"][-50:]
         
         # Salvar no Redis
-        redis.json.set(cache_key, path="$", value=existing_history)
+        await storage.json_set(cache_key, existing_history)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar mensagem: {str(e)}")
@@ -1,16 +1,18 @@
 import os
 from dotenv import load_dotenv
 import asyncio
-from openai import OpenAI
 import logging
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 import openai
 import json
+import time
 import uuid
-from upstash_redis import Redis
 from fastapi import HTTPException
+from ..lib.storage import storage
+from ..lib.openai_client import get_openai_client, openai_slot, OPENAI_TIMEOUT
+from ..lib.sse import format_sse
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -24,11 +26,14 @@ if not api_key:
     logger.error("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
     raise ValueError("OPENAI_API_KEY não configurada")
 
-client = OpenAI(api_key=api_key)
 ASSISTANT_ID = "asst_5YTQYHjXL7npoJYTLX3w0cXv"
 
-# Inicializar Redis
-redis = Redis.from_env()
+# Tempo máximo de um run do assistente (stream + fallback de polling)
+ASSISTANT_RUN_DEADLINE = float(os.getenv("ASSISTANT_RUN_DEADLINE", "90"))
+RUN_POLL_INITIAL_INTERVAL = 0.25
+RUN_POLL_MAX_INTERVAL = 2.0
+RUN_FAILED_STATES = ("failed", "cancelled", "expired", "incomplete")
+
 
 class ChatbotMessageRequest(BaseModel):
     message: str
@@ -216,44 +221,164 @@ def format_dict_as_table(data: Dict) -> str:
         
     return table
 
-async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
+async def cancel_run(thread_id: str, run_id: str):
+    """Cancela um run que não vai mais ser aproveitado (deadline, requires_action)"""
     try:
-        logger.info(f"Processando mensagem via Assistants API para user_id: {user_id}")
+        await get_openai_client().beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except openai.OpenAIError as e:
+        logger.warning(f"Não foi possível cancelar o run {run_id}: {str(e)}")
 
-        # 1. Criar um thread
-        thread_id = await get_or_create_thread_id(user_id)
 
-        # 2. Adicionar a mensagem do usuário
-        client.beta.threads.messages.create(
+def run_failure(run: Any) -> Exception:
+    """Monta a exceção de um run que terminou sem resposta"""
+    detail = ""
+    if getattr(run, "last_error", None):
+        detail = f" ({run.last_error.message})"
+    elif getattr(run, "incomplete_details", None):
+        detail = f" ({run.incomplete_details.reason})"
+    return Exception(f"Assistants API falhou com status: {run.status}{detail}")
+
+
+async def handle_requires_action(thread_id: str, run_id: str):
+    # O assistente da Ymed não tem tools registradas neste backend: o run nunca sairia desse estado
+    await cancel_run(thread_id, run_id)
+    raise Exception("Assistants API solicitou uma ação (tool call) não suportada")
+
+
+async def wait_for_run(thread_id: str, run_id: str, deadline: float) -> Any:
+    """
+    Aguarda o run chegar a um estado final via polling adaptativo
+    (começa em 250ms e dobra até 2s). Usado quando o stream de eventos não está disponível.
+    """
+    interval = RUN_POLL_INITIAL_INTERVAL
+    while True:
+        run = await get_openai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status == "completed":
+            return run
+        if run.status == "requires_action":
+            await handle_requires_action(thread_id, run_id)
+        if run.status in RUN_FAILED_STATES:
+            raise run_failure(run)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            await cancel_run(thread_id, run_id)
+            raise HTTPException(status_code=504, detail="Tempo esgotado aguardando o assistente")
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, RUN_POLL_MAX_INTERVAL)
+
+
+async def fetch_run_response(thread_id: str, run_id: str) -> str:
+    messages = await get_openai_client().beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order="desc")
+    assistant_messages = [m for m in messages.data if m.role == "assistant"]
+    if not assistant_messages:
+        raise Exception("Nenhuma resposta recebida do assistente")
+    return assistant_messages[0].content[0].text.value
+
+
+async def find_started_run(thread_id: str, since: float) -> Optional[str]:
+    """
+    Run mais recente do thread criado a partir de `since` (epoch), ou ainda ativo: o stream pode ter
+    caído depois de criar o run e antes do evento thread.run.created chegar.
+    """
+    runs = await get_openai_client().beta.threads.runs.list(thread_id=thread_id, limit=1, order="desc")
+    latest = runs.data[0] if runs.data else None
+    if latest is None:
+        return None
+    if latest.created_at >= int(since) or latest.status in ("queued", "in_progress", "requires_action", "cancelling"):
+        return latest.id
+    return None
+
+
+async def run_assistant(thread_id: str) -> AsyncIterator[str]:
+    """
+    Executa o assistente no thread e entrega o texto conforme é gerado.
+
+    Usa os eventos do stream do run (sem espera entre a conclusão e a resposta). Se o stream cair
+    (conexão/timeout de leitura), acompanha o mesmo run por polling e entrega o restante do texto.
+    Todo o processo respeita ASSISTANT_RUN_DEADLINE.
+    """
+    deadline = time.monotonic() + ASSISTANT_RUN_DEADLINE
+    started_at = time.time()
+    run_id: Optional[str] = None
+    sent = ""
+
+    try:
+        async with get_openai_client().beta.threads.runs.stream(
             thread_id=thread_id,
-            role="user",
-            content=message
-        )
+            assistant_id=ASSISTANT_ID,
+            max_completion_tokens=2500,
+            temperature=1.0,
+            timeout=min(OPENAI_TIMEOUT, ASSISTANT_RUN_DEADLINE)
+        ) as stream:
+            events = stream.__aiter__()
+            while True:
+                # O deadline vale também para um stream parado (sem eventos), não só entre eventos
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), timeout=max(deadline - time.monotonic(), 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    run_id = run_id or await find_started_run(thread_id, started_at)
+                    if run_id:
+                        await cancel_run(thread_id, run_id)
+                    raise HTTPException(status_code=504, detail="Tempo esgotado aguardando o assistente")
+
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                elif event.event == "thread.message.delta":
+                    for block in event.data.delta.content or []:
+                        if block.type == "text" and block.text and block.text.value:
+                            sent += block.text.value
+                            yield block.text.value
+                elif event.event == "thread.run.requires_action":
+                    await handle_requires_action(thread_id, event.data.id)
+                elif event.event in ("thread.run.failed", "thread.run.cancelled",
+                                     "thread.run.expired", "thread.run.incomplete"):
+                    raise run_failure(event.data)
+        return
+    except openai.APIConnectionError as e:
+        logger.warning(f"Stream do run interrompido ({str(e)}), acompanhando por polling")
 
-        # 3. Executar o assistente
-        run = client.beta.threads.runs.create(
+    if run_id is None:
+        # Não cria um segundo run se o primeiro já existe (o thread só aceita um run ativo)
+        run_id = await find_started_run(thread_id, started_at)
+    if run_id is None:
+        run = await get_openai_client().beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=ASSISTANT_ID,
             max_completion_tokens=2500,
             temperature=1.0
         )
+        run_id = run.id
 
-        # 4. Aguardar conclusão
-        while True:
-            run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            if run_status.status == "completed":
-                break
-            elif run_status.status in ["failed", "cancelled"]:
-                raise Exception(f"Assistants API falhou com status: {run_status.status}")
-            await asyncio.sleep(2)
-
-        # 5. Recuperar a resposta
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        assistant_messages = [m for m in messages.data if m.role == "assistant"]
-        if not assistant_messages:
-            raise Exception("Nenhuma resposta recebida do assistente")
+    await wait_for_run(thread_id, run_id, deadline)
+    response = await fetch_run_response(thread_id, run_id)
+    # Entrega apenas o que o stream ainda não tinha enviado
+    remainder = response[len(sent):] if response.startswith(sent) else response
+    if remainder:
+        yield remainder
 
-        bot_response = assistant_messages[0].content[0].text.value
+
+async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
+    try:
+        logger.info(f"Processando mensagem via Assistants API para user_id: {user_id}")
+
+        # 1. Criar um thread
+        thread_id = await get_or_create_thread_id(user_id)
+
+        async with openai_slot():
+            # 2. Adicionar a mensagem do usuário
+            await get_openai_client().beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=message
+            )
+
+            # 3-5. Executar o assistente e recuperar a resposta assim que o run concluir
+            bot_response = "".join([part async for part in run_assistant(thread_id)])
+        if not bot_response:
+            raise Exception("Nenhuma resposta recebida do assistente")
         
         # Verificar se é uma solicitação de tabela e formatar se necessário
         if is_table_request(message):
@@ -271,6 +396,8 @@ async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
             "timestamp": datetime.now().isoformat()
         }
 
+    except HTTPException:
+        raise
     except openai.OpenAIError as e:
         logger.error(f"Erro da OpenAI (Assistants API): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro da OpenAI: {str(e)}")
@@ -278,9 +405,56 @@ async def process_chatbot_message(message: str, user_id: str) -> Dict[str, Any]:
         logger.error(f"Erro geral: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem: {str(e)}")
 
+async def stream_chatbot_message(message: str, user_id: str) -> AsyncIterator[str]:
+    """
+    Versão em streaming via Assistants API: envia o texto do assistente como eventos SSE
+    conforme o run gera a resposta e salva o histórico ao final.
+    """
+    try:
+        logger.info(f"Processando mensagem (stream) via Assistants API para user_id: {user_id}")
+        thread_id = await get_or_create_thread_id(user_id)
+
+        parts: List[str] = []
+        async with openai_slot():
+            await get_openai_client().beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=message
+            )
+
+            async for part in run_assistant(thread_id):
+                parts.append(part)
+                yield format_sse("token", {"content": part})
+
+        bot_response = "".join(parts)
+        if not bot_response:
+            raise Exception("Nenhuma resposta recebida do assistente")
+
+        if is_table_request(message):
+            bot_response = format_json_as_table(bot_response)
+
+        message_id = str(uuid.uuid4())
+        await save_message_to_history(user_id, message_id, message, bot_response)
+
+        yield format_sse("done", {
+            "success": True,
+            "message_id": message_id,
+            "response": bot_response,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except HTTPException as e:
+        yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    except openai.OpenAIError as e:
+        logger.error(f"Erro da OpenAI (Assistants API, stream): {str(e)}")
+        yield format_sse("error", {"status_code": 500, "detail": f"Erro da OpenAI: {str(e)}"})
+    except Exception as e:
+        logger.error(f"Erro geral (stream): {str(e)}")
+        yield format_sse("error", {"status_code": 500, "detail": f"Erro ao processar mensagem: {str(e)}"})
+
 async def get_or_create_thread_id(user_id: str) -> str:
     cache_key = f"chatbot_thread_{user_id}"
-    existing = redis.get(cache_key)
+    existing = await storage.get(cache_key)
     if existing:
         # Verificar se já é string ou se precisa decodificar
         if isinstance(existing, bytes):
@@ -288,8 +462,8 @@ async def get_or_create_thread_id(user_id: str) -> str:
         return existing
 
     # Criar um novo thread
-    thread = client.beta.threads.create()
-    redis.set(cache_key, thread.id)
+    thread = await get_openai_client().beta.threads.create()
+    await storage.set(cache_key, thread.id)
     return thread.id
 
 async def get_conversation_history(user_id: str) -> Dict[str, Any]:
@@ -298,7 +472,7 @@ async def get_conversation_history(user_id: str) -> Dict[str, Any]:
     """
     try:
         cache_key = f"chatbot_conversation_{user_id}"
-        cached_history = redis.json.get(cache_key)
+        cached_history = await storage.json_get(cache_key)
         
         if cached_history:
             return cached_history[0]
@@ -318,7 +492,7 @@ async def clear_conversation_history(user_id: str) -> Dict[str, Any]:
     """
     try:
         cache_key = f"chatbot_conversation_{user_id}"
-        redis.json.delete(cache_key)
+        await storage.json_delete(cache_key)
         
         return {
             "success": True,
@@ -353,7 +527,7 @@ async def save_message_to_history(user_id: str, message_id: str, message: str, r
             existing_history["messages"] = existing_history["messages"][-50:]
         
         # Salvar no Redis
-        redis.json.set(cache_key, path="$", value=existing_history)
+        await storage.json_set(cache_key, existing_history)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar mensagem: {str(e)}")
@@ -0,0 +1,177 @@
+"""
+Índices secundários e consultas sobre os cursos em cache
+Filtros (status, fase, coordenador, texto), projeção de campos e paginação por cursor.
+Os índices são montados uma vez por versão do cache (ver cache.get_view), não a cada requisição.
+"""
+
+import base64
+import binascii
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+COURSES_PAGE_MAX = 500
+
+# Valor do filtro `status` para cursos ainda sem decisão (status vazio no Pipefy)
+PENDING_STATUS = "pendente"
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Minúsculas e sem acentos, para comparar filtros com os valores do Pipefy"""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    return "".join(c for c in text if not unicodedata.combining(c)).strip().lower()
+
+
+def course_sort_key(slug):
+    # Mesma ordem de sort_and_reorder_dict: chaves numéricas primeiro, depois alfabética.
+    # O slug original desempata ("01" e "1", "ABC" e "abc"): a chave é única e o cursor não pula itens
+    try:
+        return (0, int(slug), str(slug))
+    except (ValueError, TypeError):
+        return (1, str(slug).lower(), str(slug))
+
+
+def coordinator_names(course: dict) -> List[str]:
+    names = [course.get("coordenadorSolicitante"), course.get("coordenador")]
+    names.extend(c.get("nome") for c in course.get("coordenadores") or [] if isinstance(c, dict))
+    return [name for name in names if name]
+
+
+@dataclass
+class CourseIndex:
+    courses: Dict[str, dict]
+    order: List[str]  # slugs na ordem das listagens
+    by_status: Dict[str, Set[str]]
+    by_fase: Dict[str, Set[str]]
+    by_coordenador: Dict[str, Set[str]]
+    search_text: Dict[str, str]
+
+
+def build_course_index(courses: Dict[str, dict]) -> CourseIndex:
+    by_status: Dict[str, Set[str]] = {}
+    by_fase: Dict[str, Set[str]] = {}
+    by_coordenador: Dict[str, Set[str]] = {}
+    search_text: Dict[str, str] = {}
+
+    for slug, course in courses.items():
+        by_status.setdefault(normalize_text(course.get("status")), set()).add(slug)
+        if course.get("fase"):
+            by_fase.setdefault(normalize_text(course["fase"]), set()).add(slug)
+        names = coordinator_names(course)
+        for name in names:
+            by_coordenador.setdefault(normalize_text(name), set()).add(slug)
+        search_text[slug] = normalize_text(" ".join([
+            slug, course.get("nome") or "", course.get("nomeDoCurso") or "", *names
+        ]))
+
+    return CourseIndex(
+        courses=courses,
+        order=sorted(courses, key=course_sort_key),
+        by_status=by_status,
+        by_fase=by_fase,
+        by_coordenador=by_coordenador,
+        search_text=search_text,
+    )
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [normalize_text(v) for v in (value or "").split(",") if v.strip()]
+
+
+def _status_values(value: Optional[str]) -> List[str]:
+    """Valores do filtro de status; `pendente` também seleciona os cursos com status vazio"""
+    values = _split(value)
+    return values + [""] if PENDING_STATUS in values else values
+
+
+_URLSAFE_TO_STANDARD = str.maketrans("-_", "+/")
+
+
+def encode_cursor(slug: str) -> str:
+    return base64.urlsafe_b64encode(slug.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    # validate=True: urlsafe_b64decode descartaria em silêncio caracteres fora do alfabeto
+    # (ex.: "!!!" viraria um slug vazio e a listagem recomeçaria da primeira página)
+    try:
+        slug = base64.b64decode(cursor.translate(_URLSAFE_TO_STANDARD).encode("ascii"), validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not slug:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return slug
+
+
+@dataclass
+class CourseQuery:
+    """
+    Parâmetros de consulta das listagens de cursos (todos opcionais; separar múltiplos valores por vírgula).
+    Cursos sem decisão (status vazio) são filtrados com status=pendente.
+    """
+    status: Optional[str] = None
+    fase: Optional[str] = None
+    coordenador: Optional[str] = None
+    q: Optional[str] = None
+    fields: Optional[str] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+
+    def __post_init__(self):
+        if self.limit is not None and not 1 <= self.limit <= COURSES_PAGE_MAX:
+            raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {COURSES_PAGE_MAX}")
+
+    def is_empty(self) -> bool:
+        return not any((self.status, self.fase, self.coordenador, self.q, self.fields, self.limit, self.cursor))
+
+
+def _union(index: Dict[str, Set[str]], values: Iterable[str]) -> Set[str]:
+    result: Set[str] = set()
+    for value in values:
+        result |= index.get(value, set())
+    return result
+
+
+def project(course: dict, fields: Optional[List[str]], field_order: list) -> dict:
+    if not fields:
+        keys = [k for k in field_order if k in course] + [k for k in course if k not in field_order]
+    else:
+        wanted = set(fields)
+        keys = [k for k in field_order if k in wanted and k in course] + [
+            k for k in fields if k not in field_order and k in course
+        ]
+    return {k: course[k] for k in keys}
+
+
+def query_courses(index: CourseIndex, query: CourseQuery, field_order: list) -> Tuple[Dict[str, dict], Optional[str], int]:
+    """Aplica filtros, cursor e projeção; retorna (cursos da página, próximo cursor, total filtrado)"""
+    candidates: Optional[Set[str]] = None
+    for values, secondary in (
+        (_status_values(query.status), index.by_status),
+        (_split(query.fase), index.by_fase),
+        (_split(query.coordenador), index.by_coordenador),
+    ):
+        if values:
+            matched = _union(secondary, values)
+            candidates = matched if candidates is None else candidates & matched
+
+    ordered = index.order if candidates is None else [slug for slug in index.order if slug in candidates]
+    if query.q:
+        term = normalize_text(query.q)
+        ordered = [slug for slug in ordered if term in index.search_text[slug]]
+
+    total = len(ordered)
+    if query.cursor:
+        after = course_sort_key(decode_cursor(query.cursor))
+        ordered = [slug for slug in ordered if course_sort_key(slug) > after]
+
+    next_cursor = None
+    if query.limit and len(ordered) > query.limit:
+        ordered = ordered[:query.limit]
+        next_cursor = encode_cursor(ordered[-1])
+
+    fields = [f.strip() for f in query.fields.split(",") if f.strip()] if query.fields else None
+    page = {slug: project(index.courses[slug], fields, field_order) for slug in ordered}
+    return page, next_cursor, total
@@ -1,14 +1,19 @@
 import os
 from fastapi import HTTPException
-import httpx
-from typing import Dict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+from pydantic import BaseModel
 import json
 import re
-from ..lib.models import CourseUnyleya, CourseYMED, ApiResponse, CourseUpdate
-from ..lib.pipefy_auth import get_pipefy_headers, PIPEFY_API_URL
+from ..lib.models import CourseUnyleya, CourseYMED, CourseUpdate
+from ..lib.pipefy_client import execute
+from ..lib.pipefy_scheduler import BACKGROUND, pipefy_lane
+from ..lib.pipefy_pagination import PIPEFY_PAGE_SIZE, paginate
+from ..lib.parse_cache import get_parse_cache
 import warnings
 from dotenv import load_dotenv
-from functools import reduce
+from dataclasses import dataclass
+from functools import lru_cache
 import logging
 import traceback
 
@@ -19,7 +24,20 @@ warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 if os.getenv("ENVIRONMENT") == "development":
     load_dotenv()
 
-API_URL = PIPEFY_API_URL
+# Incrementar ao mudar o parsing: invalida os cards já parseados no cache de parsing
+UNYLEYA_PARSER_VERSION = "1"
+YMED_PARSER_VERSION = "1"
+
+# Atualizações em lote: aliases de updateCardField por documento (limite de complexidade do Pipefy)
+# e documentos enviados ao mesmo tempo
+PIPEFY_MUTATION_CHUNK_SIZE = int(os.getenv("PIPEFY_MUTATION_CHUNK_SIZE", "25"))
+PIPEFY_MUTATION_CONCURRENCY = int(os.getenv("PIPEFY_MUTATION_CONCURRENCY", "4"))
+
+# Cards buscados por id num único documento (sync incremental)
+PIPEFY_CARDS_PER_QUERY = int(os.getenv("PIPEFY_CARDS_PER_QUERY", "25"))
+
+# Janela para agrupar buscas de fases pedidas quase ao mesmo tempo numa única varredura
+PIPEFY_PHASE_BATCH_WINDOW = float(os.getenv("PIPEFY_PHASE_BATCH_WINDOW", "0.05"))
 
 def generate_slug_from_name(nome: str) -> str:
     """Gera um slug a partir do nome do curso"""
@@ -42,439 +60,698 @@ def generate_slug_from_name(nome: str) -> str:
     slug = re.sub(r'-+', '-', slug).strip('-')
     return slug
 
-def parse_api_response_unyleya(api_response: ApiResponse, phase_name: str) -> Dict[str, CourseUnyleya]:
-    courses: Dict[str, CourseUnyleya] = {}
+# Decoders dos campos do card Unyleya: cada um recebe o estado do card, o valor (native_value sem espaços) e o campo
+@dataclass
+class _UnyleyaCardState:
+    course: CourseUnyleya
+    coordenador_nomes: List[str]
 
-    edges = api_response.data.get("phase", {}).get("cards", {}).get("edges", [])
-    logger.info(f"Começando parsing de {len(edges)} cursos para fase: {phase_name}")
 
-    def process_edge(edge):
-        try:
-            if not edge.get("node", {}).get("id") or not edge.get("node", {}).get("fields"):
-                logger.warning("Edge sem id ou fields, pulando")
-                return None
-
-            fields = edge["node"]["fields"]
-            child_relations = edge["node"].get("child_relations", [])
-
-            course = CourseUnyleya(
-                id=edge["node"]["id"],
-                entity="Unyleya",
-                slug="",
-                nome="",
-                coordenadorSolicitante="Sem coordenador",
-                coordenadores=[],
-                apresentacao="",
-                publico="",
-                concorrentesIA=[],
-                performance="",
-                videoUrl="",
-                disciplinasIA=[],
-                status="",
-                observacoesComite="",
-                statusPreComite="",
-                observacoesPreComite="",
-                cargaHoraria=0,
-                fase=phase_name
-            )
-
-            def process_field(course, field):
-                if not field.get("name"):
-                    raise ValueError("Campo sem nome encontrado na resposta da API")
-
-                value = field.get("native_value", "").strip() or ""
-
-                # Verificar diferentes nomes possíveis para o campo slug
-                if field["name"] in ["curso-slug", "Curso Slug", "Slug", "slug", "Slug do Curso"]:
-                    course.slug = value.strip()
-                if field["name"] == "Selecione o cadastro" or field.get("field", {}).get("id") == "nome_completo":
-                    if value:
-                        course.coordenadorSolicitante = value.strip() if "[" not in value else value.split("[")[0].strip()
-
-                if field["name"] == "Nome do Curso":
-                    if "[" in value:
-                        course.nome = value.split("[")[0].strip()
-                    else:
-                        course.nome = value.strip()
-                elif field["name"] == "Apresentação IA":
-                    course.apresentacao = value
-                elif field["name"] == "Público Alvo IA":
-                    course.publico = value
-                elif field["name"] == "Concorrentes IA":
-                    if value:
-                        try:
-                            formatted_value = value.strip()
-                            if not (formatted_value.startswith("[") and formatted_value.endswith("]")):
-                                raise ValueError("Formato JSON inválido para Concorrentes IA")
-
-                            formatted_value = formatted_value.replace(",\n]", "]")
-                            parsed_value = json.loads(formatted_value)
-
-                            if isinstance(parsed_value, str):
-                                parsed_value = json.loads(parsed_value)
-
-                            if isinstance(parsed_value, list):
-                                course.concorrentesIA = [
-                                    {
-                                        "instituicao": str(item.split(";")[0].strip()),
-                                        "curso": str(f"{item.split(';')[1].strip()} - {item.split(';')[2].strip()}"),
-                                        "link": str(item.split(";")[3].strip()),
-                                        "valor": str(item.split(";")[4].strip()) if len(item.split(";")) > 4 else "Valor desconhecido"
-                                    }
-                                    for item in parsed_value
-                                ]
-                            else:
-                                raise ValueError("Valor analisado não é uma lista")
-                        except Exception as error:
-                            logger.warning(f"Erro ao processar Concorrentes IA: {error}")
-                            course.concorrentesIA = [{
-                                "instituicao": "Erro ao processar",
-                                "curso": "Erro ao processar",
-                                "link": "#",
-                                "valor": "Erro ao processar"
-                            }]
-                elif field["name"] == "Performance de Cursos / Área correlatas":
-                    course.performance = value
-                elif field["name"] == "Vídeo de Defesa da Proposta de Curso":
-                    course.videoUrl = value
-                elif field["name"] == "Disciplinas IA":
-                    if value:
-                        course.disciplinasIA = []
-                        disciplinas = value.split("\n")
-
-                        for disciplina in disciplinas:
-                            valores = disciplina.split(";")
-                            if len(valores) >= 1:
-                                nome = valores[0]
-                                carga = valores[1] if len(valores) > 1 else "0"
-                                if len(valores) > 2:
-                                    tipo = "Reuso" if any(substring in valores[2].strip().lower() for substring in ["aproveitamento", "reaproveitamento", "reuso"]) else "Nova"
-                                else:
-                                    tipo = "Não informado"
-                            else:
-                                nome = "Disciplina sem nome"
-                                carga = "0"
-                                tipo = "Não informado"
-                                
-                            try:
-                                carga = re.search(r'\d+', carga).group()
-                            except AttributeError:
-                                carga = 0
-                            course.disciplinasIA.append({
-                                "nome": nome,
-                                "carga": int(carga),
-                                "tipo": tipo
-                            })
-                        course.cargaHoraria = sum(disciplina["carga"] for disciplina in course.disciplinasIA)
-
-                        disciplinas_desenvolvimento = [
-                            "Desenvolvimento Profissional".lower(),
-                            "Desenvolvimento Pessoal e Profissional nas Carreiras da Saúde".lower()
-                        ]
-                        if not any(d["nome"].lower() in disciplinas_desenvolvimento for d in course.disciplinasIA):
-                            course.disciplinasIA.insert(0, {
-                                "nome": "Desenvolvimento Profissional",
-                                "carga": 40,
-                                "tipo": "Reuso"
-                            })
-                            course.cargaHoraria += 40
-                elif field["name"] == "Status Pré-Comitê":
-                    course.statusPreComite = value
-                elif field["name"] == "Status Pós-Comitê":
-                    course.status = value
-                elif field["name"] == "Observações do Pré-Comitê":
-                    course.observacoesPreComite = value
-                elif field["name"] == "Observações do Comitê":
-                    course.observacoesComite = value
-                return course
-
-            # Use reduce to process all fields
-            course = reduce(process_field, fields, course)
-
-            # Debug: Mostrar todos os nomes de campos disponíveis se estiver na fase pré-comitê
-            if phase_name == "precomite" and len(fields) > 0:
-                field_names = [f.get("name", "SEM_NOME") for f in fields]
-
-            # Se o slug não foi definido pelos campos, gerar um baseado no nome do curso
-            if not course.slug or course.slug.strip() == "":
-                if course.nome:
-                    course.slug = generate_slug_from_name(course.nome)
-                else:
-                    return None
-
-            coordenador_nomes = [
-                field["native_value"].strip() if "[" not in field["native_value"] else field["native_value"].split("[")[0].strip()
-                for field in fields
-                if field["name"].strip().startswith("Coordenador") and field.get("native_value")
-            ]
-
-            coordenadores_info = {}
-            for relation in child_relations:
-                if relation.get("cards"):
-                    coord_card = relation["cards"][0]
-                    coord_fields = coord_card["fields"]
-
-                    nome_field = next((f for f in coord_fields if f.get("name", "").lower() == "nome completo"), None)
-                    if not nome_field or not nome_field.get("value"):
-                        continue
+FieldDecoder = Callable[[_UnyleyaCardState, str, dict], None]
 
-                    nome = nome_field["value"].strip()
-                    minibiografia = next((f["value"] for f in coord_fields if f.get("name") == "Minibiografia"), "")
-                    ja_e_coordenador = next((f["value"] == "Sim" for f in coord_fields if f.get("name") == "Já é coordenador da Unyleya?"), False)
 
-                    coordenadores_info[nome] = {
-                        "minibiografia": minibiografia,
-                        "jaECoordenador": ja_e_coordenador
-                    }
+def _set_attr(attr: str) -> FieldDecoder:
+    def decode(state: _UnyleyaCardState, value: str, field: dict):
+        setattr(state.course, attr, value)
+    return decode
 
-            def build_coordenador(nome):
-                if nome in coordenadores_info:
-                    return {
-                        "nome": nome,
-                        "minibiografia": coordenadores_info[nome]["minibiografia"],
-                        "jaECoordenador": coordenadores_info[nome]["jaECoordenador"]
-                    }
-                else:
-                    return {
-                        "nome": nome,
-                        "minibiografia": "",
-                        "jaECoordenador": False
-                    }
 
-            course.coordenadores = list(map(build_coordenador, coordenador_nomes))
+def _strip_bracket_suffix(value: str) -> str:
+    """Remove o sufixo "[...]" que o Pipefy anexa a alguns valores (ex.: "Fulano [id]")"""
+    return value.strip() if "[" not in value else value.split("[")[0].strip()
 
-            # Verificar se o slug está vazio - isso pode causar problemas
-            if not course.slug or course.slug.strip() == "":
-                return None
 
-            return (course.slug, course)
+def _decode_slug(state: _UnyleyaCardState, value: str, field: dict):
+    state.course.slug = value.strip()
 
-        except Exception as error:
-            logger.error(f"Erro ao processar edge: {error}")
-            return None
 
-    # Use filter and dict to build the courses dictionary
-    courses = dict(filter(lambda x: x is not None, map(process_edge, edges)))
-    return courses
+def _decode_coordenador_solicitante(state: _UnyleyaCardState, value: str, field: dict):
+    if value:
+        state.course.coordenadorSolicitante = _strip_bracket_suffix(value)
+
+
+def _decode_nome(state: _UnyleyaCardState, value: str, field: dict):
+    state.course.nome = _strip_bracket_suffix(value)
 
-def parse_api_response_ymed(api_response: ApiResponse) -> Dict[str, CourseYMED]:
-    courses = {}
-    edges = api_response.data.get("phase", {}).get("cards", {}).get("edges", [])
-
-    def get_slug(nome_do_curso: str):
-        slug = nome_do_curso.lower()
-        slug = re.sub(r'[áàãâ]', 'a', slug)
-        slug = re.sub(r'[éê]', 'e', slug)
-        slug = re.sub(r'[í]', 'i', slug)
-        slug = re.sub(r'[óôõ]', 'o', slug)
-        slug = re.sub(r'[ú]', 'u', slug)
-        slug = re.sub(r'[ç]', 'c', slug)
-        slug = re.sub(r'[^a-z0-9\s-]', '', slug)
-        slug = re.sub(r'\s+', '-', slug)
-        slug = re.sub(r'-+', '-', slug).strip('-')
-        return slug
-
-    def process_edge(edge):
-        node = edge.get("node", {})
-        fields = node.get("fields", [])
-        field_map = {f.get("name"): f.get("native_value") for f in fields}
-        benchmark_raw = field_map.get("Benchmark", "").strip().split("\n") if field_map.get("Benchmark") else []
-        benchmark = json.loads(benchmark_raw[0]) if benchmark_raw else []
-
-        course = CourseYMED(
-            id=node.get("id"),
-            entity="YMED",
+
+def _decode_coordenador(state: _UnyleyaCardState, value: str, field: dict):
+    if field.get("native_value"):
+        state.coordenador_nomes.append(_strip_bracket_suffix(field["native_value"]))
+
+
+def _decode_concorrentes(state: _UnyleyaCardState, value: str, field: dict):
+    if not value:
+        return
+    try:
+        formatted_value = value.strip()
+        if not (formatted_value.startswith("[") and formatted_value.endswith("]")):
+            raise ValueError("Formato JSON inválido para Concorrentes IA")
+
+        formatted_value = formatted_value.replace(",\n]", "]")
+        parsed_value = json.loads(formatted_value)
+
+        if isinstance(parsed_value, str):
+            parsed_value = json.loads(parsed_value)
+
+        if not isinstance(parsed_value, list):
+            raise ValueError("Valor analisado não é uma lista")
+
+        concorrentes = []
+        for item in parsed_value:
+            partes = item.split(";")
+            concorrentes.append({
+                "instituicao": str(partes[0].strip()),
+                "curso": str(f"{partes[1].strip()} - {partes[2].strip()}"),
+                "link": str(partes[3].strip()),
+                "valor": str(partes[4].strip()) if len(partes) > 4 else "Valor desconhecido"
+            })
+        state.course.concorrentesIA = concorrentes
+    except Exception as error:
+        logger.warning(f"Erro ao processar Concorrentes IA: {error}")
+        state.course.concorrentesIA = [{
+            "instituicao": "Erro ao processar",
+            "curso": "Erro ao processar",
+            "link": "#",
+            "valor": "Erro ao processar"
+        }]
+
+
+DISCIPLINAS_REUSO = ("aproveitamento", "reaproveitamento", "reuso")
+DISCIPLINAS_DESENVOLVIMENTO = (
+    "Desenvolvimento Profissional".lower(),
+    "Desenvolvimento Pessoal e Profissional nas Carreiras da Saúde".lower()
+)
+CARGA_RE = re.compile(r'\d+')
+
+
+def _decode_disciplinas(state: _UnyleyaCardState, value: str, field: dict):
+    if not value:
+        return
+    course = state.course
+    course.disciplinasIA = []
+
+    for disciplina in value.split("\n"):
+        valores = disciplina.split(";")
+        nome = valores[0]
+        carga = valores[1] if len(valores) > 1 else "0"
+        if len(valores) > 2:
+            tipo_informado = valores[2].strip().lower()
+            tipo = "Reuso" if any(substring in tipo_informado for substring in DISCIPLINAS_REUSO) else "Nova"
+        else:
+            tipo = "Não informado"
+
+        match = CARGA_RE.search(carga)
+        course.disciplinasIA.append({
+            "nome": nome,
+            "carga": int(match.group()) if match else 0,
+            "tipo": tipo
+        })
+    course.cargaHoraria = sum(disciplina["carga"] for disciplina in course.disciplinasIA)
+
+    if not any(d["nome"].lower() in DISCIPLINAS_DESENVOLVIMENTO for d in course.disciplinasIA):
+        course.disciplinasIA.insert(0, {
+            "nome": "Desenvolvimento Profissional",
+            "carga": 40,
+            "tipo": "Reuso"
+        })
+        course.cargaHoraria += 40
+
+
+# Registro de decoders por nome e por id do campo no Pipefy
+UNYLEYA_FIELD_DECODERS_BY_NAME: Dict[str, FieldDecoder] = {
+    "Nome do Curso": _decode_nome,
+    "Apresentação IA": _set_attr("apresentacao"),
+    "Público Alvo IA": _set_attr("publico"),
+    "Concorrentes IA": _decode_concorrentes,
+    "Performance de Cursos / Área correlatas": _set_attr("performance"),
+    "Vídeo de Defesa da Proposta de Curso": _set_attr("videoUrl"),
+    "Disciplinas IA": _decode_disciplinas,
+    "Status Pré-Comitê": _set_attr("statusPreComite"),
+    "Status Pós-Comitê": _set_attr("status"),
+    "Observações do Pré-Comitê": _set_attr("observacoesPreComite"),
+    "Observações do Comitê": _set_attr("observacoesComite"),
+    "Selecione o cadastro": _decode_coordenador_solicitante,
+}
+for _slug_name in ("curso-slug", "Curso Slug", "Slug", "slug", "Slug do Curso"):
+    UNYLEYA_FIELD_DECODERS_BY_NAME[_slug_name] = _decode_slug
+
+UNYLEYA_FIELD_DECODERS_BY_ID: Dict[str, FieldDecoder] = {
+    "nome_completo": _decode_coordenador_solicitante,
+}
+
+
+@lru_cache(maxsize=1024)
+def _unyleya_decoders_for(name: str, field_id: Optional[str]) -> Tuple[FieldDecoder, ...]:
+    """Resolve (uma vez por combinação nome/id) quais decoders se aplicam a um campo"""
+    decoders = []
+    by_name = UNYLEYA_FIELD_DECODERS_BY_NAME.get(name)
+    by_id = UNYLEYA_FIELD_DECODERS_BY_ID.get(field_id) if field_id else None
+    if by_name:
+        decoders.append(by_name)
+    if by_id and by_id is not by_name:
+        decoders.append(by_id)
+    if name.strip().startswith("Coordenador"):
+        decoders.append(_decode_coordenador)
+    return tuple(decoders)
+
+
+def _parse_coordenadores_info(child_relations: list) -> Dict[str, dict]:
+    coordenadores_info = {}
+    for relation in child_relations:
+        if relation.get("cards"):
+            coord_card = relation["cards"][0]
+            coord_fields = coord_card["fields"]
+
+            nome_field = next((f for f in coord_fields if f.get("name", "").lower() == "nome completo"), None)
+            if not nome_field or not nome_field.get("value"):
+                continue
+
+            nome = nome_field["value"].strip()
+            minibiografia = next((f["value"] for f in coord_fields if f.get("name") == "Minibiografia"), "")
+            ja_e_coordenador = next((f["value"] == "Sim" for f in coord_fields if f.get("name") == "Já é coordenador da Unyleya?"), False)
+
+            coordenadores_info[nome] = {
+                "minibiografia": minibiografia,
+                "jaECoordenador": ja_e_coordenador
+            }
+    return coordenadores_info
+
+
+def parse_unyleya_node(node: dict, phase_name: str) -> Optional[CourseUnyleya]:
+    """Converte um card da fase em CourseUnyleya, percorrendo os campos uma única vez"""
+    if not node.get("id") or not node.get("fields"):
+        logger.warning("Edge sem id ou fields, pulando")
+        return None
+
+    fields = node["fields"]
+    child_relations = node.get("child_relations", [])
+
+    state = _UnyleyaCardState(
+        course=CourseUnyleya(
+            id=node["id"],
+            entity="Unyleya",
             slug="",
-            nomeDoCurso=field_map.get("Nome do Curso"),
-            coordenador=field_map.get("Coordenador"),
-            justificativaIntroducao=field_map.get("Justificativa/Introdução"),
-            lacunaFormacaoGap=field_map.get("Lacuna de Formação (Gap)"),
-            propostaCurso=field_map.get("Proposta do Curso"),
-            publicoAlvo=field_map.get("Público-Alvo"),
-            conteudoProgramatico=field_map.get("Conteúdo Programático"),
-            mercado=field_map.get("Mercado"),
-            diferencialCurso=field_map.get("Diferencial do Curso"),
-            observacoesGerais=field_map.get("Observações Gerais"),
-            status=field_map.get("Status Pós-Comitê") or "",
-            observacoesComite=field_map.get("Observações do Comitê") or "",
-            performance=field_map.get("Performance da Área") or "",
-            concorrentes=benchmark or []
-        )
-        course.slug = get_slug(course.nomeDoCurso)
-        return (course.slug, course)
+            nome="",
+            coordenadorSolicitante="Sem coordenador",
+            coordenadores=[],
+            apresentacao="",
+            publico="",
+            concorrentesIA=[],
+            performance="",
+            videoUrl="",
+            disciplinasIA=[],
+            status="",
+            observacoesComite="",
+            statusPreComite="",
+            observacoesPreComite="",
+            cargaHoraria=0,
+            fase=phase_name
+        ),
+        coordenador_nomes=[]
+    )
+
+    for field in fields:
+        name = field.get("name")
+        if not name:
+            raise ValueError("Campo sem nome encontrado na resposta da API")
+
+        decoders = _unyleya_decoders_for(name, (field.get("field") or {}).get("id"))
+        if decoders:
+            value = field.get("native_value", "").strip() or ""
+            for decode in decoders:
+                decode(state, value, field)
+
+    course = state.course
+    # Se o slug não foi definido pelos campos, gerar um baseado no nome do curso
+    if not course.slug or course.slug.strip() == "":
+        if not course.nome:
+            return None
+        course.slug = generate_slug_from_name(course.nome)
+        if not course.slug:
+            return None
 
-    courses = dict(map(process_edge, edges))
-    return courses
+    coordenadores_info = _parse_coordenadores_info(child_relations)
+    course.coordenadores = [
+        {
+            "nome": nome,
+            "minibiografia": coordenadores_info.get(nome, {}).get("minibiografia", ""),
+            "jaECoordenador": coordenadores_info.get(nome, {}).get("jaECoordenador", False)
+        }
+        for nome in state.coordenador_nomes
+    ]
+    return course
+
+
+def generate_ymed_slug(nome_do_curso: str) -> str:
+    slug = nome_do_curso.lower()
+    slug = re.sub(r'[áàãâ]', 'a', slug)
+    slug = re.sub(r'[éê]', 'e', slug)
+    slug = re.sub(r'[í]', 'i', slug)
+    slug = re.sub(r'[óôõ]', 'o', slug)
+    slug = re.sub(r'[ú]', 'u', slug)
+    slug = re.sub(r'[ç]', 'c', slug)
+    slug = re.sub(r'[^a-z0-9\s-]', '', slug)
+    slug = re.sub(r'\s+', '-', slug)
+    slug = re.sub(r'-+', '-', slug).strip('-')
+    return slug
 
-# Essa função busca os cursos pré-comitê do Pipefy
-async def get_courses_pre_comite():
-    QUERY = """
-    {
-    phase(id:"339377838") {
-        cards (first: 50) {
-        edges {
-            node {
-            id
-            fields {
-                name
-                native_value
-                field {
-                label
-                id
+def parse_ymed_node(node: dict) -> CourseYMED:
+    fields = node.get("fields", [])
+    field_map = {f.get("name"): f.get("native_value") for f in fields}
+    benchmark_raw = field_map.get("Benchmark", "").strip().split("\n") if field_map.get("Benchmark") else []
+    benchmark = json.loads(benchmark_raw[0]) if benchmark_raw else []
+
+    course = CourseYMED(
+        id=node.get("id"),
+        entity="YMED",
+        slug="",
+        nomeDoCurso=field_map.get("Nome do Curso"),
+        coordenador=field_map.get("Coordenador"),
+        justificativaIntroducao=field_map.get("Justificativa/Introdução"),
+        lacunaFormacaoGap=field_map.get("Lacuna de Formação (Gap)"),
+        propostaCurso=field_map.get("Proposta do Curso"),
+        publicoAlvo=field_map.get("Público-Alvo"),
+        conteudoProgramatico=field_map.get("Conteúdo Programático"),
+        mercado=field_map.get("Mercado"),
+        diferencialCurso=field_map.get("Diferencial do Curso"),
+        observacoesGerais=field_map.get("Observações Gerais"),
+        status=field_map.get("Status Pós-Comitê") or "",
+        observacoesComite=field_map.get("Observações do Comitê") or "",
+        performance=field_map.get("Performance da Área") or "",
+        concorrentes=benchmark or []
+    )
+    course.slug = generate_ymed_slug(course.nomeDoCurso)
+    return course
+
+@dataclass(frozen=True)
+class CardProjection:
+    """
+    O que o parser de uma fase lê de cada card; build_card_selection pede ao Pipefy só isso.
+    O schema do Pipefy não filtra `fields` por id, então todos os campos vêm, mas só com name/native_value.
+    """
+    field_ids: bool = False  # field { id }: decoders indexados por id (UNYLEYA_FIELD_DECODERS_BY_ID)
+    coordinators: bool = False  # child_relations: minibiografia/"já é coordenador" dos coordenadores
+
+def build_card_selection(projection: CardProjection) -> str:
+    field_id = """
+                        field {
+                            id
+                        }""" if projection.field_ids else ""
+    relations = """
+                    child_relations {
+                        cards {
+                            fields {
+                                name
+                                value
+                            }
+                        }
+                    }""" if projection.coordinators else ""
+    return f"""
+                    id
+                    fields {{
+                        name
+                        native_value{field_id}
+                    }}{relations}
+"""
+
+# Uma projeção por parser, não por consumidor: listagem, detalhe e home leem o mesmo dataset parseado
+# do cache (uma varredura por fase). A listagem completa devolve `coordenadores` com minibiografia e
+# "já é coordenador", então child_relations continua na projeção Unyleya mesmo que a home não os use.
+UNYLEYA_PROJECTION = CardProjection(field_ids=True, coordinators=True)
+YMED_PROJECTION = CardProjection()  # parse_ymed_node só lê name/native_value
+
+UNYLEYA_CARD_SELECTION = build_card_selection(UNYLEYA_PROJECTION)
+YMED_CARD_SELECTION = build_card_selection(YMED_PROJECTION)
+
+PHASE_CARDS_QUERY = """
+query PhaseCards($phaseId: ID!, $first: Int, $after: String) {
+    phase(id: $phaseId) {
+        cards(first: $first, after: $after) {
+            edges {
+                node {
+%s
                 }
             }
-            child_relations {
-                __typename
-                cards {
-                fields {
-                    name
-                    value
-                }
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+        }
+    }
+}
+"""
+
+# Primeira página de várias fases num único documento: um bloco com alias por fase
+PHASE_FIRST_PAGE_BLOCK = """
+    %(alias)s: phase(id: $%(alias)s) {
+        cards(first: $first) {
+            edges {
+                node {
+%(selection)s
                 }
             }
+            pageInfo {
+                hasNextPage
+                endCursor
             }
         }
-        pageInfo {
-            hasNextPage
-            startCursor
-            endCursor
-        }
-        }
-    }
-    }
-    """
-
-    try:
-        all_edges = []
-        cursor = None
-        has_next_page = True
-
-        async with httpx.AsyncClient() as client:
-            while has_next_page:
-                paginated_query = QUERY
-                if cursor:
-                    paginated_query = QUERY.replace(
-                        'cards (first: 50)', f'cards (first: 50, after: "{cursor}")'
-                    )
-                else:
-                    paginated_query = QUERY
-
-                headers = await get_pipefy_headers()
-                response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={"query": paginated_query}
-                )
-
-                if not response.is_success:
-                    raise HTTPException(status_code=response.status_code, detail="Erro na requisição ao Pipefy")
-
-                payload = response.json().get("data", {}).get("phase", {}).get("cards", {})
-                edges = payload.get("edges", [])
-                page_info = payload.get("pageInfo", {})
-                all_edges.extend(edges)
-
-                has_next_page = page_info.get("hasNextPage", False)
-                cursor = page_info.get("endCursor")
-
-        nested_data = {
-            "phase": {
-                "cards": {
-                    "edges": all_edges
+    }"""
+
+# Sincronização incremental: ids da fase (para detectar remoções) e cards do pipe alterados desde a última sync
+PHASE_CARD_IDS_QUERY = PHASE_CARDS_QUERY % "                    id"
+
+PHASE_PIPE_QUERY = """
+query PhasePipe($phaseId: ID!) {
+    phase(id: $phaseId) {
+        cards(first: 1) {
+            edges {
+                node {
+                    pipe {
+                        id
+                    }
                 }
             }
         }
-        api_response = ApiResponse(data=nested_data)
-        courses_result = parse_api_response_unyleya(api_response, phase_name="precomite")
-        return courses_result
-    
-    except Exception as error:
-        error_msg = f"Erro ao buscar cursos pré-comitê: {str(error)}\n{traceback.format_exc()}"
-        logger.error(error_msg)
-        print(error_msg)
-        raise HTTPException(status_code=500, detail=f"Falha ao buscar cursos pré-comitê: {str(error)}")
+    }
+}
+"""
 
-async def get_courses_unyleya():
-    QUERY = """
-    {
-    phase(id:"333225221") {
-        cards (first: 50) {
+UPDATED_CARDS_QUERY = """
+query UpdatedCards($pipeId: ID!, $since: String!, $first: Int, $after: String) {
+    allCards(pipeId: $pipeId, first: $first, after: $after, filter: {field: "updated_at", operator: gt, value: $since}) {
         edges {
             node {
-            id
-            fields {
-                name
-                native_value
-                field {
-                label
-                id
-                }
-            }
-            child_relations {
-                __typename
-                cards {
-                fields {
-                    name
-                    value
+                current_phase {
+                    id
                 }
-                }
-            }
+%s
             }
         }
         pageInfo {
             hasNextPage
-            startCursor
             endCursor
         }
+    }
+}
+"""
+
+UPDATED_CARDS_QUERY_IDS = UPDATED_CARDS_QUERY % "                id"
+
+CARD_QUERY = """
+query Card($cardId: ID!) {
+    card(id: $cardId) {
+        current_phase {
+            id
         }
+%s
     }
+}
+"""
+
+# Vários cards por id num único documento (um alias por card)
+CARD_BLOCK = """
+    %(alias)s: card(id: $%(alias)s) {
+        id
+%(selection)s
+    }"""
+
+@dataclass(frozen=True)
+class CoursePhase:
+    """Fase do Pipefy acompanhada pela API: como buscar e parsear seus cards e a chave de cache onde ficam"""
+    phase_id: str
+    name: str
+    cache_key: str
+    parse_node: Callable[[dict], Optional[BaseModel]]
+    selection: str
+    model: type
+    parser_version: str
+    parse_cache_name: str
+
+    @property
+    def cards_query(self) -> str:
+        return PHASE_CARDS_QUERY % self.selection
+
+    @property
+    def alias(self) -> str:
+        return f"phase_{self.phase_id}"
+
+# phase_id -> fase (varreduras, sincronização incremental e webhook)
+COURSE_PHASES: Dict[str, CoursePhase] = {
+    phase.phase_id: phase
+    for phase in (
+        CoursePhase(
+            "333225221", "comite", "courses_data", lambda node: parse_unyleya_node(node, "comite"),
+            UNYLEYA_CARD_SELECTION, CourseUnyleya, UNYLEYA_PARSER_VERSION, "unyleya:comite",
+        ),
+        CoursePhase(
+            "339377838", "precomite", "pre_comite_courses_data", lambda node: parse_unyleya_node(node, "precomite"),
+            UNYLEYA_CARD_SELECTION, CourseUnyleya, UNYLEYA_PARSER_VERSION, "unyleya:precomite",
+        ),
+        CoursePhase(
+            "339017044", "ymed", "ymed_courses_data", parse_ymed_node,
+            YMED_CARD_SELECTION, CourseYMED, YMED_PARSER_VERSION, "ymed:339017044",
+        ),
+    )
+}
+
+def build_phases_first_page_query(phases: List[CoursePhase]) -> str:
+    declarations = ", ".join(f"${phase.alias}: ID!" for phase in phases)
+    blocks = "".join(
+        PHASE_FIRST_PAGE_BLOCK % {"alias": phase.alias, "selection": phase.selection} for phase in phases
+    )
+    return f"query PhasesFirstPage({declarations}, $first: Int) {{{blocks}\n}}\n"
+
+def _collect_phase_page(phase: CoursePhase, parse_cache, page: dict, courses: Dict[str, BaseModel]):
+    for edge in page.get("edges", []):
+        try:
+            course = parse_cache.parse(edge.get("node", {}), phase.parse_node, phase.name)
+        except Exception as error:
+            logger.error(f"Erro ao processar edge da fase {phase.name}: {error}")
+            continue
+        if course is not None:
+            courses[course.slug] = course
+
+async def _crawl_phase(phase: CoursePhase, first_page: dict, page_size: Optional[int]) -> Dict[str, BaseModel]:
+    """Parseia a primeira página (já baixada) e continua a paginação da fase, se houver mais páginas"""
+    courses: Dict[str, BaseModel] = {}
+    parse_cache = await get_parse_cache(phase.parse_cache_name, phase.model, phase.parser_version).session()
+    _collect_phase_page(phase, parse_cache, first_page, courses)
+    page_info = first_page.get("pageInfo") or {}
+    if page_info.get("hasNextPage") and page_info.get("endCursor"):
+        async for page in paginate(
+            phase.cards_query, ("phase", "cards"), {"phaseId": phase.phase_id}, page_size, after=page_info["endCursor"]
+        ):
+            _collect_phase_page(phase, parse_cache, page, courses)
+    await parse_cache.commit()
+    return courses
+
+async def _fetch_phases(phases: List[CoursePhase], page_size: Optional[int] = None) -> Dict[str, object]:
+    """
+    Primeira página de todas as fases numa só requisição; só as fases com mais páginas continuam,
+    em paralelo. Retorna phase_id -> cursos, ou a exceção da fase que falhou.
+    """
+    variables = {"first": page_size or PIPEFY_PAGE_SIZE, **{phase.alias: phase.phase_id for phase in phases}}
+    response = await execute(build_phases_first_page_query(phases), variables)
+    data = response.get("data") or {}
+    if response.get("errors") and not data:
+        raise Exception(response["errors"][0].get("message", "Erro GraphQL no Pipefy"))
+    errors = {
+        str((error.get("path") or [""])[0]): error.get("message", "Erro GraphQL no Pipefy")
+        for error in response.get("errors") or []
     }
+
+    async def crawl(phase: CoursePhase):
+        connection = (data.get(phase.alias) or {}).get("cards")
+        if connection is None:
+            raise Exception(errors.get(phase.alias, f"Fase {phase.phase_id} não encontrada no Pipefy"))
+        return await _crawl_phase(phase, connection, page_size)
+
+    results = await asyncio.gather(*(crawl(phase) for phase in phases), return_exceptions=True)
+    return {phase.phase_id: result for phase, result in zip(phases, results)}
+
+class PhaseBatcher:
     """
+    Agrupa as fases pedidas dentro de uma janela curta (ex.: /refresh-data, cold start da home)
+    numa única varredura via _fetch_phases. Pedidos simultâneos da mesma fase compartilham o resultado.
 
-    try:
-        all_edges = []
-        cursor = None
-        has_next_page = True
-
-        async with httpx.AsyncClient() as client:
-            while has_next_page:
-                paginated_query = QUERY
-                if cursor:
-                    paginated_query = QUERY.replace(
-                        'cards (first: 50)', f'cards (first: 50, after: "{cursor}")'
-                    )
+    O agrupamento é best-effort: cada loader passa antes pelo lock do cache no Redis, e um pedido que
+    chega depois da janela vai para a varredura seguinte (o resultado é o mesmo, só sem a economia).
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush: Optional[asyncio.Task] = None
+
+    async def load(self, phase_id: str) -> Dict[str, BaseModel]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(phase_id, []).append(future)
+        if self._flush is None:
+            self._flush = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        pending: Dict[str, List[asyncio.Future]] = {}
+        results: Dict[str, object] = {}
+        try:
+            await asyncio.sleep(self._window)
+            pending, self._pending, self._flush = self._pending, {}, None
+            phases = [COURSE_PHASES[phase_id] for phase_id in pending]
+            logger.info(f"Buscando fases {', '.join(phase.name for phase in phases)} do Pipefy")
+            try:
+                with pipefy_lane(BACKGROUND):
+                    results = await _fetch_phases(phases)
+            except Exception as error:
+                results = {phase_id: error for phase_id in pending}
+        finally:
+            if self._flush is asyncio.current_task():
+                # Cancelado ainda na janela (ex.: encerramento): assume os pedidos acumulados
+                pending, self._pending, self._flush = self._pending, {}, None
+            # Nenhum pedido fica esperando para sempre, mesmo se a varredura foi cancelada
+            for phase_id, futures in pending.items():
+                if phase_id in results:
+                    result = results[phase_id]
                 else:
-                    paginated_query = QUERY
-
-                headers = await get_pipefy_headers()
-                response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={"query": paginated_query}
-                )
-
-                if not response.is_success:
-                    raise HTTPException(status_code=response.status_code, detail="Erro na requisição ao Pipefy")
-
-                payload = response.json().get("data", {}).get("phase", {}).get("cards", {})
-                edges = payload.get("edges", [])
-                page_info = payload.get("pageInfo", {})
-                all_edges.extend(edges)
-
-                has_next_page = page_info.get("hasNextPage", False)
-                cursor = page_info.get("endCursor")
-
-        nested_data = {
-            "phase": {
-                "cards": {
-                    "edges": all_edges
-                }
-            }
-        }
-        api_response = ApiResponse(data=nested_data)
-        courses_result = parse_api_response_unyleya(api_response, phase_name="comite")
-        return courses_result
+                    result = Exception(f"Busca da fase {phase_id} interrompida")
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+_phase_batcher = PhaseBatcher(PIPEFY_PHASE_BATCH_WINDOW)
+
+async def fetch_phase_courses(phase_id: str) -> Dict[str, BaseModel]:
+    """Cursos de uma fase do registro, agrupando a busca com outras fases pedidas ao mesmo tempo"""
+    return await _phase_batcher.load(phase_id)
+
+@dataclass
+class PhaseDelta:
+    """Alterações de uma fase desde a última sincronização"""
+    changed: Dict[str, BaseModel]  # card_id -> curso parseado (apenas cards que estão na fase)
+    card_ids: Set[str]  # todos os cards presentes na fase agora
+    # Cards da fase buscados mas sem curso (sem nome/slug ou erro de parsing): gravados nos metadados
+    # do cache para não serem buscados de novo a cada sync enquanto não mudarem
+    unparsed: Set[str]
+
+# phase_id -> pipe_id (descoberto uma vez por worker)
+_phase_pipes: Dict[str, str] = {}
+
+async def get_phase_pipe_id(phase_id: str) -> Optional[str]:
+    if phase_id not in _phase_pipes:
+        response = await execute(PHASE_PIPE_QUERY, {"phaseId": phase_id})
+        if "errors" in response:
+            raise Exception(response["errors"][0]["message"])
+        edges = (((response.get("data") or {}).get("phase") or {}).get("cards") or {}).get("edges") or []
+        if not edges:
+            return None
+        _phase_pipes[phase_id] = edges[0]["node"]["pipe"]["id"]
+    return _phase_pipes[phase_id]
+
+async def fetch_phase_card_ids(phase_id: str) -> Set[str]:
+    card_ids: Set[str] = set()
+    async for page in paginate(PHASE_CARD_IDS_QUERY, ("phase", "cards"), {"phaseId": phase_id}):
+        card_ids.update(str(edge["node"]["id"]) for edge in page.get("edges", []))
+    return card_ids
+
+async def fetch_card_node(card_id: str, selection: str) -> Optional[dict]:
+    response = await execute(CARD_QUERY % selection, {"cardId": str(card_id)})
+    if "errors" in response:
+        raise Exception(response["errors"][0]["message"])
+    return (response.get("data") or {}).get("card")
+
+async def fetch_card_nodes(card_ids: Iterable[str], selection: str) -> Dict[str, dict]:
+    """Busca vários cards por id em documentos com aliases (PIPEFY_CARDS_PER_QUERY por requisição)"""
+    ids = sorted(str(card_id) for card_id in card_ids)
+    chunks = [ids[i:i + PIPEFY_CARDS_PER_QUERY] for i in range(0, len(ids), PIPEFY_CARDS_PER_QUERY)]
+
+    async def fetch_chunk(chunk: List[str]) -> Dict[str, dict]:
+        aliases = {f"card_{card_id}": card_id for card_id in chunk}
+        declarations = ", ".join(f"${alias}: ID!" for alias in aliases)
+        blocks = "".join(CARD_BLOCK % {"alias": alias, "selection": selection} for alias in aliases)
+        response = await execute(f"query Cards({declarations}) {{{blocks}\n}}\n", aliases)
+        data = response.get("data") or {}
+        if response.get("errors") and not data:
+            raise Exception(response["errors"][0].get("message", "Erro GraphQL no Pipefy"))
+        return {card_id: data[alias] for alias, card_id in aliases.items() if data.get(alias)}
+
+    nodes: Dict[str, dict] = {}
+    for result in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        nodes.update(result)
+    return nodes
+
+async def fetch_phase_delta(
+    phase_id: str,
+    since: str,
+    known_ids: Set[str],
+    selection: str,
+    parse_node: Callable[[dict], Optional[BaseModel]],
+) -> Optional[PhaseDelta]:
+    """
+    Busca só os cards do pipe alterados desde `since` que estão na fase, mais a lista de ids
+    da fase (barata) para detectar remoções e cards que entraram sem aparecer no filtro.
+    Retorna None quando a fase está vazia e o pipe não pode ser descoberto.
+    """
+    pipe_id = await get_phase_pipe_id(phase_id)
+    if pipe_id is None:
+        return None
+
+    async def fetch_updated_ids() -> Set[str]:
+        # Só id/fase: o allCards percorre o pipe inteiro, e os cards de outras fases são descartados
+        updated_ids: Set[str] = set()
+        async for page in paginate(UPDATED_CARDS_QUERY_IDS, ("allCards",), {"pipeId": pipe_id, "since": since}):
+            for edge in page.get("edges", []):
+                node = edge["node"]
+                if str((node.get("current_phase") or {}).get("id")) == str(phase_id):
+                    updated_ids.add(str(node["id"]))
+        return updated_ids
+
+    updated_ids, card_ids = await asyncio.gather(fetch_updated_ids(), fetch_phase_card_ids(phase_id))
+
+    # Conteúdo completo só dos cards alterados na fase e dos que entraram sem aparecer no filtro
+    wanted = (updated_ids & card_ids) | (card_ids - known_ids)
+    updated = await fetch_card_nodes(wanted, selection) if wanted else {}
+
+    changed: Dict[str, BaseModel] = {}
+    unparsed: Set[str] = set()
+    for card_id, node in updated.items():
+        if card_id not in card_ids:
+            continue
+        try:
+            course = parse_node(node)
+        except Exception as error:
+            logger.error(f"Erro ao processar card {card_id}: {error}")
+            course = None
+        if course is not None:
+            changed[card_id] = course
+        else:
+            unparsed.add(card_id)
+
+    logger.info(
+        f"Sync incremental da fase {phase_id}: {len(changed)} alterados, {len(unparsed)} sem curso, "
+        f"{len(card_ids)} cards na fase"
+    )
+    return PhaseDelta(changed=changed, card_ids=card_ids, unparsed=unparsed)
+
+# Essa função busca os cursos pré-comitê do Pipefy
+async def get_courses_pre_comite():
+    try:
+        return await fetch_phase_courses("339377838")
+    except HTTPException:
+        raise
+    except Exception as error:
+        error_msg = f"Erro ao buscar cursos pré-comitê: {str(error)}\n{traceback.format_exc()}"
+        logger.error(error_msg)
+        print(error_msg)
+        raise HTTPException(status_code=500, detail=f"Falha ao buscar cursos pré-comitê: {str(error)}")
 
+async def get_courses_unyleya():
+    try:
+        return await fetch_phase_courses("333225221")
+    except HTTPException:
+        raise
     except Exception as error:
         error_msg = f"Erro ao buscar cursos Unyleya: {str(error)}\n{traceback.format_exc()}"
         logger.error(error_msg)
@@ -482,113 +759,105 @@ async def get_courses_unyleya():
         raise HTTPException(status_code=500, detail=f"Falha ao buscar cursos: {str(error)}")
 
 async def get_courses_ymed():
-    QUERY = """
-    {\n  phase(id: \"339017044\") {\n    cards_count\n    cards(first: 50) {\n      pageInfo {\n        hasNextPage\n        startCursor\n        endCursor\n      }\n      edges {\n        node {\n          id\n          fields {\n            name\n            native_value\n            field {\n              label\n              id\n            }\n          }\n        }\n      }\n    }\n  }\n}\n    """
     try:
-        all_edges = []
-        cursor = None
-        has_next_page = True
-        async with httpx.AsyncClient() as client:
-            while has_next_page:
-                paginated_query = QUERY
-                if cursor:
-                    paginated_query = QUERY.replace(
-                        'cards(first: 50)', f'cards(first: 50, after: "{cursor}")'
-                    )
-                
-                headers = await get_pipefy_headers()
-                response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={"query": paginated_query}
-                )
-                if not response.is_success:
-                    raise HTTPException(status_code=response.status_code, detail="Erro na requisição ao Pipefy")
-                payload = response.json().get("data", {}).get("phase", {}).get("cards", {})
-                edges = payload.get("edges", [])
-                page_info = payload.get("pageInfo", {})
-                all_edges.extend(edges)
-                has_next_page = page_info.get("hasNextPage", False)
-                cursor = page_info.get("endCursor")
-        nested_data = {
-            "phase": {
-                "cards": {
-                    "edges": all_edges
-                }
-            }
-        }
-        api_response = ApiResponse(data=nested_data)
-        return parse_api_response_ymed(api_response)
+        return await fetch_phase_courses("339017044")
+    except HTTPException:
+        raise
     except Exception as error:
         error_msg = f"Erro ao buscar cursos YMED: {str(error)}\n{traceback.format_exc()}"
         logger.error(error_msg)
         print(error_msg)
         raise HTTPException(status_code=500, detail=f"Falha ao buscar cursos YMED: {str(error)}")
 
-async def update_course_status(course_update: CourseUpdate):
-    UPDATE_CARD_FIELD_MUTATION = """
-    mutation UpdateCardField($input: UpdateCardFieldInput!) {
-        updateCardField(input: $input) {
-            success
-        }
+# Versões incrementais: retornam apenas o delta desde `since` (ISO 8601) para ser mesclado no cache
+async def _phase_delta(phase: CoursePhase, since: str, known_ids: Set[str]) -> Optional[PhaseDelta]:
+    with pipefy_lane(BACKGROUND):
+        return await fetch_phase_delta(phase.phase_id, since, known_ids, phase.selection, phase.parse_node)
+
+async def get_courses_pre_comite_delta(since: str, known_ids: Set[str]) -> Optional[PhaseDelta]:
+    return await _phase_delta(COURSE_PHASES["339377838"], since, known_ids)
+
+async def get_courses_unyleya_delta(since: str, known_ids: Set[str]) -> Optional[PhaseDelta]:
+    return await _phase_delta(COURSE_PHASES["333225221"], since, known_ids)
+
+async def get_courses_ymed_delta(since: str, known_ids: Set[str]) -> Optional[PhaseDelta]:
+    return await _phase_delta(COURSE_PHASES["339017044"], since, known_ids)
+
+CARD_PHASE_SELECTION = "        id"
+
+async def fetch_course_card(card_id: str) -> Optional[dict]:
+    """
+    Busca um card com a projeção da fase em que ele está: primeiro só current_phase (barato),
+    depois os campos que o parser da fase lê. Fora das fases acompanhadas retorna o nó sem os campos.
+    """
+    node = await fetch_card_node(card_id, CARD_PHASE_SELECTION)
+    phase = COURSE_PHASES.get(str(((node or {}).get("current_phase") or {}).get("id")))
+    if phase is None:
+        return node
+    return await fetch_card_node(card_id, phase.selection)
+
+# Field ids de status/observações no Pipefy, por etapa (pré-comitê ou comitê)
+STATUS_FIELD_IDS = {
+    True: ("status_pr_comit", "observa_es_do_pr_comit"),
+    False: ("status_p_s_comit", "observa_es_do_comit"),
+}
+
+def course_update_inputs(course_update: CourseUpdate) -> Dict[str, dict]:
+    """Inputs de updateCardField de uma decisão, por alias: status e (se fornecidas) observações"""
+    if not course_update.courseId:
+        raise ValueError("Course ID é obrigatório")
+    if not course_update.status:
+        raise ValueError("Selecione pelo menos um status")
+    status_field_id, observations_field_id = STATUS_FIELD_IDS[course_update.is_pre_comite]
+    inputs = {
+        "status": {"card_id": course_update.courseId, "field_id": status_field_id, "new_value": course_update.status},
     }
+    if course_update.observations is not None:
+        inputs["observations"] = {
+            "card_id": course_update.courseId,
+            "field_id": observations_field_id,
+            "new_value": course_update.observations,
+        }
+    return inputs
+
+def build_update_card_fields_mutation(inputs: Dict[str, dict]) -> Tuple[str, dict]:
+    """Um único documento com um updateCardField por alias (cada um com sua variável de input)"""
+    declarations = ", ".join(f"${alias}: UpdateCardFieldInput!" for alias in inputs)
+    selections = "\n".join(f"    {alias}: updateCardField(input: ${alias}) {{ success }}" for alias in inputs)
+    return f"mutation UpdateCardFields({declarations}) {{\n{selections}\n}}", dict(inputs)
+
+def mutation_errors(data: dict, aliases: Iterable[str]) -> Dict[str, str]:
+    """
+    Erros de uma mutation com aliases, indexados pelo alias que falhou.
+    Um alias só é confirmado com data[alias].success verdadeiro; sem data, todo o documento falhou.
     """
+    errors: Dict[str, str] = {}
+    for error in data.get("errors") or []:
+        path = error.get("path") or [""]
+        errors.setdefault(str(path[0]), error.get("message", "Erro desconhecido"))
+    # Erros sem path (documento rejeitado) valem para todos os aliases
+    fallback = errors.get("", "Pipefy não confirmou a atualização")
+    results = data.get("data")
+    if not isinstance(results, dict):
+        return {alias: errors.get(alias, fallback) for alias in aliases}
+    return {
+        alias: errors.get(alias, fallback)
+        for alias in aliases
+        if not (results.get(alias) or {}).get("success")
+    }
+
+async def update_course_status(course_update: CourseUpdate):
     if not course_update.courseId:
         raise HTTPException(status_code=400, detail="Course ID é obrigatório")
 
     try:
-        async with httpx.AsyncClient() as client:
-            # Determinar o field_id correto baseado no contexto
-            if course_update.is_pre_comite:
-                status_field_id = "status_pr_comit"  # Field ID para pré-comitê
-                observations_field_id = "observa_es_do_pr_comit"  # Field ID para observações do pré-comitê
-            else:
-                status_field_id = "status_p_s_comit"  # Field ID para pós-comitê (atual)
-                observations_field_id = "observa_es_do_comit"  # Field ID para observações do comitê (atual)
-
-            # Atualizar status se fornecido
-            if course_update.status:
-                headers = await get_pipefy_headers()
-                status_response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={
-                        "query": UPDATE_CARD_FIELD_MUTATION,
-                        "variables": {
-                            "input": {
-                                "card_id": course_update.courseId,
-                                "field_id": status_field_id,
-                                "new_value": course_update.status,
-                            }
-                        },
-                    },
-                )
-                status_data = status_response.json()
-                if "errors" in status_data:
-                    raise Exception(status_data["errors"][0]["message"])
-            else:
-                raise Exception("Selecione pelo menos um status")
-
-            # Atualizar observações se fornecidas
-            if course_update.observations is not None:
-                headers = await get_pipefy_headers()
-                observations_response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={
-                        "query": UPDATE_CARD_FIELD_MUTATION,
-                        "variables": {
-                            "input": {
-                                "card_id": course_update.courseId,
-                                "field_id": observations_field_id,
-                                "new_value": course_update.observations,
-                            }
-                        },
-                    },
-                )
-                observations_data = observations_response.json()
-                if "errors" in observations_data:
-                    raise Exception(observations_data["errors"][0]["message"])
+        # Status e observações vão na mesma requisição (uma mutation com aliases)
+        inputs = course_update_inputs(course_update)
+        query, variables = build_update_card_fields_mutation(inputs)
+        data = await execute(query, variables)
+        errors = mutation_errors(data, inputs)
+        if errors:
+            raise Exception(next(iter(errors.values())))
 
         return {
             "success": True,
@@ -599,41 +868,116 @@ async def update_course_status(course_update: CourseUpdate):
     except Exception as error:
         raise HTTPException(status_code=400, detail=f"Falha ao atualizar dados do curso. Error: {error}")
 
-async def get_home_data():
-    unyleya_courses_data = await get_courses_unyleya()
-    ymed_courses_data = await get_courses_ymed()
+def chunk_course_updates(inputs_by_item: Dict[int, Dict[str, dict]]) -> List[Dict[int, Dict[str, dict]]]:
+    """Agrupa as decisões em documentos de até PIPEFY_MUTATION_CHUNK_SIZE aliases, sem separar status e observações"""
+    chunks: List[Dict[int, Dict[str, dict]]] = []
+    current: Dict[int, Dict[str, dict]] = {}
+    size = 0
+    for position, inputs in inputs_by_item.items():
+        if current and size + len(inputs) > PIPEFY_MUTATION_CHUNK_SIZE:
+            chunks.append(current)
+            current, size = {}, 0
+        current[position] = inputs
+        size += len(inputs)
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def update_course_status_bulk(course_updates: List[CourseUpdate]) -> List[dict]:
+    """
+    Envia várias decisões em mutations com aliases (u{posição}_status / u{posição}_observations),
+    em lotes concorrentes. Retorna um resultado por item, na ordem recebida; falhas não interrompem os demais.
+    """
+    results: List[dict] = [
+        {"courseId": update.courseId, "success": False, "status": update.status, "observations": update.observations}
+        for update in course_updates
+    ]
+    inputs_by_item: Dict[int, Dict[str, dict]] = {}
+    for position, update in enumerate(course_updates):
+        try:
+            inputs_by_item[position] = {
+                f"u{position}_{alias}": field_input for alias, field_input in course_update_inputs(update).items()
+            }
+        except ValueError as error:
+            results[position]["error"] = str(error)
+
+    semaphore = asyncio.Semaphore(PIPEFY_MUTATION_CONCURRENCY)
+
+    async def send(chunk: Dict[int, Dict[str, dict]]):
+        inputs = {alias: field_input for item_inputs in chunk.values() for alias, field_input in item_inputs.items()}
+        query, variables = build_update_card_fields_mutation(inputs)
+        try:
+            async with semaphore:
+                data = await execute(query, variables)
+        except Exception as error:
+            detail = getattr(error, "detail", None) or str(error)
+            for position in chunk:
+                results[position]["error"] = f"Falha ao atualizar dados do curso. Error: {detail}"
+            return
+        errors = mutation_errors(data, inputs)
+        for position, item_inputs in chunk.items():
+            failed = [errors[alias] for alias in item_inputs if alias in errors]
+            if failed:
+                results[position]["error"] = f"Falha ao atualizar dados do curso. Error: {failed[0]}"
+            else:
+                results[position]["success"] = True
+
+    chunks = chunk_course_updates(inputs_by_item)
+    await asyncio.gather(*(send(chunk) for chunk in chunks))
+    updated = sum(1 for result in results if result["success"])
+    logger.info(f"Atualização em lote: {updated}/{len(course_updates)} cursos em {len(chunks)} requisições")
+    return results
+
+def build_home_data(unyleya_courses: Iterable[dict], ymed_courses: Iterable[dict]) -> dict:
+    """Agrega os contadores da home a partir dos cursos (registros já serializados)"""
+    unyleya_courses = list(unyleya_courses)
+    ymed_courses = list(ymed_courses)
 
     active_projects = len({"Unyleya", "YMED"})
-    unyleya_proposals = len(unyleya_courses_data)
-    ymed_proposals = len(ymed_courses_data)
-    unyleya_coordinators = list(set([course.coordenadorSolicitante for course in unyleya_courses_data.values()]))
-    ymed_coordinators = list(set([course.coordenador for course in ymed_courses_data.values() if course.coordenador]))
+    unyleya_proposals = len(unyleya_courses)
+    ymed_proposals = len(ymed_courses)
+    unyleya_coordinators = list(set([course.get("coordenadorSolicitante") for course in unyleya_courses]))
+    ymed_coordinators = list(set([course.get("coordenador") for course in ymed_courses if course.get("coordenador")]))
     coordinators = len(unyleya_coordinators) + len(ymed_coordinators)
 
-    # Placeholder values for approved, pending, and rejected proposals
-    approved_proposals = sum(1 for course in unyleya_courses_data.values() if course.status == "Aprovado") + \
-                         sum(1 for course in ymed_courses_data.values() if course.status == "Aprovado")
-    standby_proposals = sum(1 for course in unyleya_courses_data.values() if course.status == "Stand By") + \
-                        sum(1 for course in ymed_courses_data.values() if course.status == "Stand By")
-    rejected_proposals = sum(1 for course in unyleya_courses_data.values() if course.status == "Reprovado") + \
-                         sum(1 for course in ymed_courses_data.values() if course.status == "Reprovado")
-    pendent_proposals = sum(1 for course in unyleya_courses_data.values() if course.status == "") + \
-                         sum(1 for course in ymed_courses_data.values() if course.status == "")
-    
-    result = ({
+    all_courses = unyleya_courses + ymed_courses
+    approved_proposals = sum(1 for course in all_courses if course.get("status") == "Aprovado")
+    standby_proposals = sum(1 for course in all_courses if course.get("status") == "Stand By")
+    rejected_proposals = sum(1 for course in all_courses if course.get("status") == "Reprovado")
+    pendent_proposals = sum(1 for course in all_courses if course.get("status") == "")
+
+    return {
         "total_proposals": (unyleya_proposals + ymed_proposals),
         "active_projects": active_projects,
         "coordinators": coordinators,
         "unyleya_proposals": unyleya_proposals,
         "ymed_proposals": ymed_proposals,
-        "coordinators": coordinators,
         "approved": approved_proposals,
         "standby": standby_proposals,
         "rejected": rejected_proposals,
         "pendent": pendent_proposals
-    })
+    }
 
-    return result
+# Status (pós-comitê) -> contador da home
+HOME_STATUS_COUNTERS = {
+    "Aprovado": "approved",
+    "Stand By": "standby",
+    "Reprovado": "rejected",
+    "": "pendent",
+}
+
+def apply_status_delta(home: dict, old_status: Optional[str], new_status: Optional[str]) -> dict:
+    """Ajusta os contadores da home quando um curso muda de status, sem reagregar tudo"""
+    updated = dict(home)
+    old_counter = HOME_STATUS_COUNTERS.get(old_status if old_status is not None else "")
+    new_counter = HOME_STATUS_COUNTERS.get(new_status if new_status is not None else "")
+    if old_counter == new_counter:
+        return updated
+    if old_counter:
+        updated[old_counter] = max(updated.get(old_counter, 0) - 1, 0)
+    if new_counter:
+        updated[new_counter] = updated.get(new_counter, 0) + 1
+    return updated
 
 async def create_comment_in_card(card_id: str, text: str):
     if not card_id or not text:
@@ -650,25 +994,18 @@ async def create_comment_in_card(card_id: str, text: str):
     }
     """
     try:
-        async with httpx.AsyncClient() as client:
-            headers = await get_pipefy_headers()
-            response = await client.post(
-                API_URL,
-                headers=headers,
-                json={
-                    "query": CREATE_COMMENT_MUTATION,
-                    "variables": {
-                        "input": {
-                            "card_id": card_id,
-                            "text": text
-                        }
-                    }
+        data = await execute(
+            CREATE_COMMENT_MUTATION,
+            {
+                "input": {
+                    "card_id": card_id,
+                    "text": text
                 }
-            )
-            data = response.json()
-            if "errors" in data:
-                raise Exception(data["errors"][0]["message"])
-            return data["data"]["createComment"]["comment"]
+            }
+        )
+        if "errors" in data:
+            raise Exception(data["errors"][0]["message"])
+        return data["data"]["createComment"]["comment"]
     except Exception as error:
         raise HTTPException(status_code=400, detail=f"Falha ao criar comentário. Error: {error}")
 
@@ -676,9 +1013,10 @@ async def get_card_comments_data(card_id: int):
     if not card_id:
         raise HTTPException(status_code=400, detail="Card ID é obrigatório")
     
+    # `comments` no Pipefy é uma lista simples (não paginada), então basta uma requisição
     GET_COMMENTS_QUERY = """
-    {
-        card(id: %s) {
+    query CardComments($cardId: ID!) {
+        card(id: $cardId) {
             comments {
                 id
                 text
@@ -686,24 +1024,12 @@ async def get_card_comments_data(card_id: int):
             }
         }
     }
-    """ % card_id
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            headers = await get_pipefy_headers()
-            response = await client.post(
-                API_URL,
-                headers=headers,
-                json={
-                    "query": GET_COMMENTS_QUERY,
-                    "variables": {
-                        "card_id": card_id
-                    }
-                }
-            )
-            data = response.json()
-            if "errors" in data:
-                raise Exception(data["errors"][0]["message"])
-            return data["data"]["card"]["comments"]
-        
+        data = await execute(GET_COMMENTS_QUERY, {"cardId": str(card_id)})
+        if "errors" in data:
+            raise Exception(data["errors"][0]["message"])
+        return data["data"]["card"]["comments"]
+
     except Exception as error:
         raise HTTPException(status_code=400, detail=f"Falha ao buscar comentários. Error: {error}")
@@ -5,23 +5,19 @@ import pandas as pd
 import re
 import numpy as np
 import unicodedata
-from fastapi.responses import JSONResponse, FileResponse, Response
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import FileResponse
 import pandas as pd
 import time
-from upstash_redis import Redis
 from dotenv import load_dotenv
-import orjson
 import httpx
-
-class ORJSONResponse(Response):
-    media_type = "application/json"
-    def render(self, content: any) -> bytes:
-        return orjson.dumps(content)
+from ..lib import cache
+from ..lib.storage import storage
+from ..lib.responses import cached_json_response
 
 load_dotenv()
 
-redis = Redis.from_env()
-
 def status_mapping(status):
     """Mapea o status para um valor legível."""
     status_map = {
@@ -108,7 +104,7 @@ def corrigir_coordenador(nome):
 
 async def get_dataframe():
     cache_key = "cursos_dataframe"
-    cached_data = redis.get(cache_key)
+    cached_data = await storage.get(cache_key)
     if cached_data:
         df = pd.DataFrame(json.loads(cached_data))
         print(df)
@@ -159,7 +155,7 @@ async def get_dataframe():
 
     # Converta os dados para um DataFrame
     df = pd.DataFrame(rows, columns=headers_)
-    redis.set(cache_key, value=json.loads(df.to_json(orient='records')), nx=True, ex=60*30)
+    await storage.set(cache_key, df.to_json(orient='records'), nx=True, ex=60*30)
     return df
 
 def map_status_academico(evolucao_academica):
@@ -331,16 +327,18 @@ async def save_df_g2():
     df_elastic.to_excel("Cursos G2.xlsx", index=False, sheet_name='Cursos G2')
     df_elastic.to_csv("Cursos G2.csv", index=False, encoding='utf-8')
 
-async def get_cursos_g2():
-    cache_key = "cursos_g2_data"
-    cached_data = redis.get(cache_key)
-    if cached_data:
-        data = json.loads(cached_data)
-        return JSONResponse(content=data, media_type="application/json", headers={"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS", "Access-Control-Allow-Headers": "Content-Type"})
+CORS_HEADERS = {"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS", "Access-Control-Allow-Headers": "Content-Type, If-None-Match", "Access-Control-Expose-Headers": "ETag"}
+
+async def load_cursos_g2() -> list:
     df = await get_df_g2()
-    data = df.to_dict(orient="records")
-    redis.set(cache_key, value=json.loads(df.to_json(orient='records')), nx=True, ex=60*30)
-    return JSONResponse(content=data, media_type="application/json", headers={"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS", "Access-Control-Allow-Headers": "Content-Type"})
+    return json.loads(df.to_json(orient='records'))
+
+async def load_cursos_search() -> list:
+    df = await get_df_search()
+    return json.loads(df.to_json(orient='records'))
+
+async def get_cursos_g2(request: Optional[Request] = None):
+    return await cached_json_response("g2_cursos_data", load_cursos_g2, headers=CORS_HEADERS, request=request)
 
 async def get_cursos_g2_excel():
     df = await get_df_g2()
@@ -352,19 +350,10 @@ async def get_cursos_g2_excel():
         filename="Cursos G2.xlsx"
     )
 
-async def get_cursos_search():
-    cache_key = "cursos_search_data"
-    cached_data = redis.get(cache_key)
-    if cached_data:
-        data = json.loads(cached_data)
-        return JSONResponse(content=data, media_type="application/json", headers={"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS", "Access-Control-Allow-Headers": "Content-Type"})
-    df = await get_df_search()
-    data = df.to_dict(orient="records")
-    redis.set(cache_key, value=json.loads(df.to_json(orient='records')), nx=True, ex=60*30)
-    return JSONResponse(content=data, media_type="application/json", headers={"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS", "Access-Control-Allow-Headers": "Content-Type"})
+async def get_cursos_search(request: Optional[Request] = None):
+    return await cached_json_response("g2_cursos_search_data", load_cursos_search, headers=CORS_HEADERS, request=request)
 
 async def refresh_cursos_g2():
-    redis.delete("cursos_g2_data", "cursos_search_data")
-    await get_cursos_g2()
-    await get_cursos_search()
+    await cache.refresh("g2_cursos_data", load_cursos_g2)
+    await cache.refresh("g2_cursos_search_data", load_cursos_search)
     return {"message": "Cursos G2 e Search atualizados com sucesso."}
\ No newline at end of file
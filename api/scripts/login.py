@@ -5,9 +5,13 @@ from ..lib.models import User
 from typing import Dict
 import os
 import bcrypt
-import httpx
 from dotenv import load_dotenv
-from ..lib.pipefy_auth import get_pipefy_headers, PIPEFY_API_URL
+from ..lib.pipefy_auth import PIPEFY_API_URL
+from ..lib.pipefy_client import execute
+from ..lib.pipefy_scheduler import BACKGROUND, pipefy_lane
+from ..lib.pipefy_pagination import paginate
+from ..lib.user_directory import UserDirectory
+from ..lib.cpu_pool import run_cpu_bound
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,127 +21,124 @@ if os.getenv("ENVIRONMENT") == "development":
 
 API_URL = PIPEFY_API_URL
 
-async def fetch_users_from_pipefy():
-    all_users: Dict[int, User] = {}
-
-    query = """
-    {
-        table_records(table_id: 306263425, first: 50) {
-            nodes {
-                id
-                record_fields {
-                    name
-                    value
-                    field {
-                        id
-                    }
+USERS_TABLE_ID = "306263425"
+
+USERS_QUERY = """
+query UsersTable($tableId: ID!, $first: Int, $after: String) {
+    table_records(table_id: $tableId, first: $first, after: $after) {
+        nodes {
+            id
+            record_fields {
+                name
+                value
+                field {
+                    id
                 }
             }
-            pageInfo {
-                hasNextPage
-                endCursor
-            }
+        }
+        pageInfo {
+            hasNextPage
+            endCursor
         }
     }
-    """
+}
+"""
+
+def parse_user_record(node: dict) -> User:
+    user_data = {
+        "id": node.get("id"),
+        "nome": "",
+        "email": "",
+        "password": "",
+        "permissao": "",
+        "card_id": 0
+    }
+    for field in node.get("record_fields", []):
+        field_id = field.get("field", {}).get("id")
+        value = field.get("value")
+        if field_id == "email":
+            user_data["email"] = value
+        elif field_id == "nome_completo":
+            user_data["nome"] = value
+        elif field_id == "senha":
+            user_data["password"] = value
+        elif field_id == "permiss_o":
+            user_data["permissao"] = value
+        elif field_id == "card_id":
+            user_data["card_id"] = int(value)
+
+    return User(
+        id=user_data["id"],
+        nome=user_data["nome"],
+        email=user_data["email"],
+        password=user_data["password"],
+        permissao=user_data["permissao"],
+        card_id=user_data["card_id"]
+    )
+
+async def load_users_from_pipefy() -> Dict[int, User]:
+    """Varre a tabela de usuários; levanta exceção em caso de erro ou tabela vazia"""
+    all_users: Dict[int, User] = {}
 
-    try:
-        cursor = None
-        has_next_page = True
-
-        async with httpx.AsyncClient() as client:
-            while has_next_page:
-                paginated_query = query
-                if cursor:
-                    paginated_query = query.replace(
-                        'first: 50', f'first: 50, after: "{cursor}"'
-                    )
-
-                headers = await get_pipefy_headers()
-                response = await client.post(
-                    API_URL,
-                    headers=headers,
-                    json={"query": paginated_query}
-                )
-
-                if not response.is_success:
-                    logger.error(f"Erro na requisição ao Pipefy: {response.text}")
-                    return {}
-
-                data = response.json().get("data", {}).get("table_records", {})
-                nodes = data.get("nodes", [])
-                page_info = data.get("pageInfo", {})
-
-                for node in nodes:
-                    user_data = {
-                        "id": node.get("id"),
-                        "nome": "",
-                        "email": "",
-                        "password": "",
-                        "permissao": "",
-                        "card_id": 0
-                    }
-                    for field in node.get("record_fields", []):
-                        field_id = field.get("field", {}).get("id")
-                        value = field.get("value")
-                        if field_id == "email":
-                            user_data["email"] = value
-                        elif field_id == "nome_completo":
-                            user_data["nome"] = value
-                        elif field_id == "senha":
-                            user_data["password"] = value
-                        elif field_id == "permiss_o":
-                            user_data["permissao"] = value
-                        elif field_id == "card_id":
-                            user_data["card_id"] = int(value)
-
-                    user = User(
-                        id=user_data["id"],
-                        nome=user_data["nome"],
-                        email=user_data["email"],
-                        password=user_data["password"],
-                        permissao=user_data["permissao"],
-                        card_id=user_data["card_id"]
-                    )
-                    all_users[int(user.id)] = user
-
-                has_next_page = page_info.get("hasNextPage", False)
-                cursor = page_info.get("endCursor")
+    # Varredura da tabela inteira: fila de segundo plano, atrás das chamadas interativas
+    with pipefy_lane(BACKGROUND):
+        async for page in paginate(USERS_QUERY, ("table_records",), {"tableId": USERS_TABLE_ID}):
+            for node in page.get("nodes", []):
+                user = parse_user_record(node)
+                all_users[int(user.id)] = user
 
+    if not all_users:
+        raise Exception("Pipefy não retornou usuários")
+    return all_users
+
+async def fetch_users_from_pipefy():
+    try:
+        return await load_users_from_pipefy()
     except Exception as e:
         logger.error(f"Erro ao buscar usuários do Pipefy: {e}")
         return {}
 
-    return all_users
+# Índices em memória dos usuários (e-mail, card_id), carregados no lifespan da aplicação
+user_directory = UserDirectory(fetch_users_from_pipefy)
 
-def hash_password(password: str) -> str:
+def _hash_password_sync(password: str) -> str:
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    is_same = bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+def _check_password_sync(plain_password: str, hashed_password: str) -> bool:
+    if not hashed_password:
+        return False
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        # Hash inválido no Pipefy ("Invalid salt"): trata como senha incorreta
+        return False
+
+# bcrypt leva ~250ms de CPU por chamada: roda no pool limitado para não travar o event loop
+async def hash_password(password: str) -> str:
+    return await run_cpu_bound(_hash_password_sync, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> dict:
+    is_same = await run_cpu_bound(_check_password_sync, plain_password, hashed_password)
     return {"is_same": is_same}
 
 async def login(email: str, password: str):
     try:
-        users = await fetch_users_from_pipefy()
-        if not users:
-            raise HTTPException(status_code=500, detail="Erro ao buscar usuário, tente novamente.\nCaso o erro persista entre em contato com o suporte.\nnovos.projetos@unyleya.com.br")
-
         if not email or not password:
             raise HTTPException(status_code=400, detail="Email e senha são obrigatórios")
-        
-        def get_user_by_email(email: str) -> User:
-            for user in users.values():
-                if user.email == email:
-                    return user
-            return None
-        user = get_user_by_email(email)
+
+        user = await user_directory.find_by_email(email)
+        if not user_directory.loaded:
+            raise HTTPException(status_code=500, detail="Erro ao buscar usuário, tente novamente.\nCaso o erro persista entre em contato com o suporte.\nnovos.projetos@unyleya.com.br")
         
         if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        if not verify_password(password, user.password).get("is_same", False):
-            raise HTTPException(status_code=401, detail="Senha incorreta")
+        if not (await verify_password(password, user.password)).get("is_same", False):
+            # A senha pode ter sido alterada fora desta API: recarrega o diretório e confere de novo
+            fresh = await user_directory.revalidate_by_email(email)
+            if fresh is None or fresh.password == user.password or not (await verify_password(password, fresh.password)).get("is_same", False):
+                raise HTTPException(status_code=401, detail="Senha incorreta")
+            user = fresh
         
         payload = {
             "id": user.id,
@@ -186,7 +187,7 @@ async def create_password_hash(password: str, card_id: int):
         raise HTTPException(status_code=400, detail="ID do cartão não pode ser vazio")
     
     # Criptografar a senha
-    hashed_password = hash_password(password)
+    hashed_password = await hash_password(password)
     
     query = """
     mutation {
@@ -198,31 +199,24 @@ async def create_password_hash(password: str, card_id: int):
     }
     """ % (card_id, hashed_password)
     
-    async with httpx.AsyncClient() as client:
-        headers = await get_pipefy_headers()
-        response = await client.post(
-            API_URL,
-            headers=headers,
-            json={"query": query}
+    response = await execute(query)
+    if "errors" in response:
+        raise HTTPException(
+            status_code=400,
+            detail="Erro ao atualizar senha: " + str(response["errors"][0]["message"])
         )
-        if response.status_code == 200:
-            if "errors" in response.json():
-                raise HTTPException(
-                    status_code=400,
-                    detail="Erro ao atualizar senha: " + str(response.json()["errors"][0]["message"])
-                )
-            return {
-                "success": True,
-                "message": "Senha gerada com sucesso. Verifique seu email."
-            }
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Erro ao gerar senha: " + response.text
-            )   
+
+    user = user_directory.get_by_card_id(card_id)
+    if user is not None:
+        user_directory.update_user(user.model_copy(update={"password": hashed_password}))
+    await user_directory.publish_change()
+    return {
+        "success": True,
+        "message": "Senha gerada com sucesso. Verifique seu email."
+    }
 
 async def create_code_hash(code: str):
-    hashed_code = hash_password(code)
+    hashed_code = await hash_password(code)
     return hashed_code
 
 async def reset_password(user_id: str, new_password: str):
@@ -230,13 +224,17 @@ async def reset_password(user_id: str, new_password: str):
         raise HTTPException(status_code=400, detail="ID do usuário não pode ser vazio")
     if not new_password:
         raise HTTPException(status_code=400, detail="Nova senha não pode ser vazia")
+    try:
+        record_id = int(user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="ID do usuário inválido")
     
-    hashed_password = hash_password(new_password)
+    hashed_password = await hash_password(new_password)
     
     query = f"""
     mutation {{
         setTableRecordFieldValue(
-            input: {{table_record_id: "{user_id}", field_id: "senha", value: "{hashed_password}"}}
+            input: {{table_record_id: "{record_id}", field_id: "senha", value: "{hashed_password}"}}
         ) {{
             table_record {{
                 id
@@ -245,23 +243,21 @@ async def reset_password(user_id: str, new_password: str):
     }}
     """
 
-    async with httpx.AsyncClient() as client:
-        headers = await get_pipefy_headers()
-        response = await client.post(
-            API_URL,
-            headers=headers,
-            json={"query": query}
+    response = await execute(query)
+    if "errors" in response:
+        raise HTTPException(
+            status_code=400,
+            detail="Erro ao redefinir senha: " + str(response["errors"][0]["message"])
         )
-        if response.status_code == 200:
-            return {
-                "success": True,
-                "message": "Senha redefinida com sucesso."
-            }
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Erro ao redefinir senha: " + response.text
-            )
+
+    user = user_directory.get_by_id(record_id)
+    if user is not None:
+        user_directory.update_user(user.model_copy(update={"password": hashed_password}))
+    await user_directory.publish_change()
+    return {
+        "success": True,
+        "message": "Senha redefinida com sucesso."
+    }
 
 async def reset_code(card_id: int, email: str):
     if not email:
@@ -360,59 +356,35 @@ async def reset_code(card_id: int, email: str):
     }}
     }}
     """
-    async with httpx.AsyncClient() as client:
-        headers = await get_pipefy_headers()
-        response = await client.post(
-            API_URL,
-            headers=headers,
-            json={"query": query}
-        )
-        if response.status_code == 200:
-            if "Acesso negado" in response.text:
-                raise HTTPException(status_code=400, detail="Não foi possivel criar o e-mail no Pipefy. Revise o 'card_id', se realmente existe no pipe")
-            email_id = response.json()["data"]["createInboxEmail"]["inbox_email"]["id"]
-            if not email_id:
-                raise HTTPException(status_code=500, detail="Erro ao criar e-mail no Pipefy, id do e-mail não identificado")
-
-            query_send = f"""
-            mutation {{
-              sendInboxEmail(input: {{
-                id: "{email_id}"
-              }}) {{
-                success
-              }}
-            }}
-            """
-            headers_send = await get_pipefy_headers()
-            response_send = await client.post(
-                API_URL,
-                headers=headers_send,
-                json={"query": query_send}
-            )
-            if response_send.status_code == 200:
-                return {
-                    "success": True,
-                    "message": "Código enviado com sucesso para o email.",
-                    "code": hash_password(code),
-                    "response": response_send.json()
-                }
-            else:
-                raise HTTPException(
-                    status_code=response_send.status_code,
-                    detail="Erro ao enviar o email: " + response_send.text
-                )
-            
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Erro ao enviar o código: " + response.text
-            )
+    response = await execute(query)
+    if "Acesso negado" in str(response):
+        raise HTTPException(status_code=400, detail="Não foi possivel criar o e-mail no Pipefy. Revise o 'card_id', se realmente existe no pipe")
+    email_id = response["data"]["createInboxEmail"]["inbox_email"]["id"]
+    if not email_id:
+        raise HTTPException(status_code=500, detail="Erro ao criar e-mail no Pipefy, id do e-mail não identificado")
+
+    query_send = f"""
+    mutation {{
+      sendInboxEmail(input: {{
+        id: "{email_id}"
+      }}) {{
+        success
+      }}
+    }}
+    """
+    response_send = await execute(query_send)
+    return {
+        "success": True,
+        "message": "Código enviado com sucesso para o email.",
+        "code": await hash_password(code),
+        "response": response_send
+    }
 
 async def verify_reset_code(submited_code: str, reset_code: str): 
     if not submited_code or not reset_code:
         raise HTTPException(status_code=400, detail="Os códigos não podem ser vazios")
     
-    password_check = verify_password(submited_code, reset_code)['is_same']
+    password_check = (await verify_password(submited_code, reset_code))['is_same']
     logger.debug(f"Password check: {password_check}")
     if not password_check:
         raise HTTPException(status_code=401, detail="O código de redefinição está incorreto")
@@ -424,16 +396,9 @@ async def verify_reset_code(submited_code: str, reset_code: str):
 
 async def forgot_password(email: str):
     # first check if the user exists
-    users = await fetch_users_from_pipefy()
-    if not users:
+    user = await user_directory.find_by_email(email)
+    if not user_directory.loaded:
         raise HTTPException(status_code=500, detail="Erro ao buscar usuários")
-    
-    def get_user_by_email(email: str) -> User:
-        for user in users.values():
-            if user.email == email:
-                return user
-        return None
-    user = get_user_by_email(email)
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     